@@ -9,6 +9,7 @@ import weakref
 from tornado import ioloop
 
 from sockjs import tornado as sockjs
+from sockjs.tornado.transport.rawwebsocket import RawWebSocket
 
 
 class EchoConnection(sockjs.Connection):
@@ -22,8 +23,11 @@ class EchoConnection(sockjs.Connection):
         self.weak_clients.add(self)
 
     def on_message(self, msg):
-        # For every incoming message, broadcast it to all clients
-        self.broadcast(msg)
+        # For every incoming message, broadcast it to all clients. With
+        # raw_passthrough SockJS messages arrive as validated JSON text and
+        # are relayed verbatim, raw websocket messages are plain text and
+        # have to be encoded.
+        self.broadcast(msg, raw=not isinstance(self.session, RawWebSocket))
 
     def on_close(self):
         # If client disconnects, remove him from the clients list
@@ -41,7 +45,7 @@ class EchoEndpoint(sockjs.Endpoint):
 
 
 if __name__ == '__main__':
-    options = dict()
+    options = dict(raw_passthrough=True)
 
     if len(sys.argv) > 1:
         options['immediate_flush'] = False
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+    Benchmark of the inbound frame decoding with and without the
+    `raw_passthrough` setting.
+
+    A relay that decodes the messages of a frame has to encode them again to
+    send them on, `split_frame` validates them and hands out their JSON text
+    as is.
+"""
+from __future__ import print_function
+
+import timeit
+
+from sockjs.tornado import proto
+from sockjs.tornado.util import json_decode, json_encode
+
+
+FRAMES = dict(
+    strings=['hello %d' % (i,) for i in range(50)],
+    flat=[
+        dict(
+            type='chat',
+            room='lobby',
+            user='user%d' % (i,),
+            text='hello world, message number %d' % (i,),
+            ts=1700000000 + i,
+        )
+        for i in range(50)
+    ],
+    nested=[
+        dict(type='move', pos=[i, i + 1], meta=dict(seq=i, ok=True))
+        for i in range(50)
+    ],
+)
+
+
+def decode_and_encode(frame):
+    return [json_encode(message) for message in json_decode(frame)]
+
+
+def bench(func, frame, number=2000):
+    seconds = timeit.timeit(lambda: func(frame), number=number)
+
+    return seconds / number * 1000000
+
+
+if __name__ == '__main__':
+    print('%-8s %14s %14s %14s' % (
+        'frame', 'split_frame', 'decode', 'decode+encode',
+    ))
+
+    for name, messages in sorted(FRAMES.items()):
+        # as sent by sockjs-client
+        frame = json_encode(messages)
+
+        print('%-8s %12.1fus %12.1fus %12.1fus' % (
+            name,
+            bench(proto.split_frame, frame),
+            bench(json_decode, frame),
+            bench(decode_and_encode, frame),
+        ))
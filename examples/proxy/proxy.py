@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+    Runs a SockJS routing proxy in front of several sockjs-tornado processes.
+    Start each backend with its `node_id` setting set to its name.
+
+    Usage: proxy.py port name=url [name=url ...]
+
+    e.g. proxy.py 8080 a=http://127.0.0.1:8081 b=http://127.0.0.1:8082
+"""
+import logging
+import sys
+
+from tornado import ioloop
+
+from sockjs.tornado.proxy import ProxyApplication
+
+
+if __name__ == '__main__':
+    logging.getLogger().setLevel(logging.INFO)
+
+    port = int(sys.argv[1])
+    backends = dict(arg.split('=', 1) for arg in sys.argv[2:])
+
+    app = ProxyApplication(backends)
+    app.listen(port)
+
+    ioloop.IOLoop.instance().start()
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""
+    Runs the virtual-time session lifecycle simulation and prints a report.
+
+    Usage: sim.py [sessions] [duration] [polling_ratio]
+"""
+import sys
+
+from sockjs.tornado.simulation import Simulator
+
+
+if __name__ == '__main__':
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 300
+    polling_ratio = float(sys.argv[3]) if len(sys.argv) > 3 else 0.1
+
+    sim = Simulator(sessions=sessions, polling_ratio=polling_ratio)
+    report = sim.run(duration, measure_memory=True)
+
+    for key in sorted(report):
+        print('%-20s %s' % (key, report[key]))
@@ -0,0 +1,131 @@
+"""
+Endpoint wide aggregation of inbound messages, for endpoints that would
+rather process messages from all of their sessions in bulk than make one
+Python call per message.
+"""
+
+import functools
+
+from tornado import ioloop
+
+from sockjs.tornado.log import core as LOG
+
+
+__all__ = [
+    'InboundAggregator',
+]
+
+
+class InboundAggregator(object):
+    """
+    Collects `(session_id, message)` pairs from all the sessions of an endpoint
+    into batches, bounded by size and age, and hands each batch to a callback.
+
+    :ivar callback: Called with each batch (a list of `(session_id, message)`
+        tuples).
+    :ivar max_size: The maximum number of messages in a batch. A batch is
+        handed over as soon as it is full.
+    :ivar max_delay: The maximum number of seconds a message waits in the
+        queue before its batch is handed over.
+    :ivar max_pending: The maximum number of messages that may be queued or
+        still being handled by the callback. Messages received above this
+        bound are dropped.
+    :ivar executor: If set, the callback is run in this executor (e.g. a
+        `concurrent.futures.ThreadPoolExecutor`) instead of on the IOLoop.
+    :ivar pending: The number of messages queued or being handled.
+    """
+
+    def __init__(self, callback, max_size, max_delay, max_pending,
+                 executor=None, stats=None):
+        self.callback = callback
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.executor = executor
+        self.stats = stats
+
+        self.queue = []
+        self.pending = 0
+        self.timeout = None
+
+    def add(self, session_id, messages):
+        """
+        Queue the messages received by a session.
+        """
+        room = self.max_pending - self.pending
+        dropped = len(messages) - room
+
+        if dropped > 0:
+            if self.stats:
+                self.stats.on_batch_dropped(dropped)
+
+            if room <= 0:
+                return
+
+            messages = messages[:room]
+
+        self.queue.extend((session_id, msg) for msg in messages)
+        self.pending += len(messages)
+
+        if self.stats:
+            self.stats.on_batch_queued(len(messages))
+
+        if len(self.queue) >= self.max_size:
+            self.flush()
+
+            return
+
+        if self.timeout is None:
+            self.timeout = ioloop.IOLoop.current().call_later(
+                self.max_delay,
+                self.flush,
+            )
+
+    def flush(self):
+        """
+        Hand everything that is queued over to the callback.
+        """
+        if self.timeout is not None:
+            ioloop.IOLoop.current().remove_timeout(self.timeout)
+            self.timeout = None
+
+        queue, self.queue = self.queue, []
+        max_size = self.max_size
+
+        for i in range(0, len(queue), max_size):
+            self.handle(queue[i:i + max_size])
+
+    def handle(self, batch):
+        if self.stats:
+            self.stats.on_batch(len(batch))
+
+        if self.executor:
+            future = self.executor.submit(self.callback, batch)
+
+            ioloop.IOLoop.current().add_future(
+                future,
+                functools.partial(self.batch_done, len(batch)),
+            )
+
+            return
+
+        try:
+            self.callback(batch)
+        except Exception:
+            LOG.exception('Failed to handle batch of %d', len(batch))
+        finally:
+            self.done(len(batch))
+
+    def batch_done(self, size, future):
+        self.done(size)
+
+        exc = future.exception()
+
+        if exc is not None:
+            LOG.error('Failed to handle batch of %d: %r', size, exc)
+
+    def done(self, size):
+        self.pending -= size
+
+        if self.stats:
+            self.stats.on_batch_done(size)
@@ -0,0 +1,161 @@
+"""
+Incremental delivery of broadcasts to very large audiences.
+"""
+
+from tornado import concurrent
+from tornado import ioloop
+
+from sockjs.tornado import proto
+
+
+__all__ = [
+    'Broadcaster',
+]
+
+
+def merge(messages):
+    """
+    Return a single message that carries all of `messages`.
+    """
+    if len(messages) == 1:
+        return messages[0]
+
+    return proto.PreparedBatch(messages)
+
+
+class Broadcaster(object):
+    """
+    Delivers broadcasts to the active sessions of an endpoint a slice at a
+    time, yielding to the IOLoop between slices so that a broadcast to 100k
+    sessions does not block everything else.
+
+    Broadcasts made while a delivery pass is in progress are merged into the
+    next pass, which delivers all of them to each session in a single frame
+    (a :ref:`proto.PreparedBatch`, shared by every session that receives all
+    of them). Only the sessions excluded from some of the broadcasts get a
+    batch of their own. Every session therefore receives broadcasts in the
+    order they were made.
+    Sessions that open after a pass has started do not receive the broadcasts
+    in that pass.
+
+    :ivar slice_size: The number of sessions delivered to per IOLoop
+        iteration.
+    :ivar pending: `(message, exclude, future)` tuples of the broadcasts
+        waiting for the next pass.
+    """
+
+    def __init__(self, endpoint, slice_size):
+        self.endpoint = endpoint
+        self.slice_size = slice_size
+
+        self.pending = []
+        self.scheduled = False
+
+        # state of the current pass
+        self.recipients = None
+        self.position = 0
+        self.messages = None
+        # what sessions that are excluded from none of the messages are sent
+        self.everyone = None
+        # the ids of the sessions excluded from any of the messages
+        self.excluded = None
+
+    def broadcast(self, message, exclude=None):
+        """
+        Queue a :ref:`proto.PreparedMessage` for delivery to every active
+        session.
+
+        :returns: A future that resolves once the message has been handed to
+            every recipient.
+        """
+        future = concurrent.Future()
+
+        self.pending.append((message, exclude, future))
+        self.schedule()
+
+        return future
+
+    def schedule(self):
+        if self.scheduled:
+            return
+
+        self.scheduled = True
+
+        ioloop.IOLoop.current().add_callback(self.run)
+
+    def start_pass(self):
+        self.messages, self.pending = self.pending, []
+        self.recipients = list(self.endpoint.active_sessions.values())
+        self.position = 0
+
+        self.everyone = merge([msg for msg, _, _ in self.messages])
+        self.excluded = set()
+
+        for _, exclude, _ in self.messages:
+            if exclude:
+                self.excluded.update(exclude)
+
+    def finish_pass(self):
+        messages, self.messages = self.messages, None
+        self.recipients = None
+        self.everyone = None
+        self.excluded = None
+
+        for _, _, future in messages:
+            future.set_result(None)
+
+    def run(self):
+        self.scheduled = False
+
+        if self.messages is None:
+            if not self.pending:
+                return
+
+            self.start_pass()
+
+        start = self.position
+        end = self.position = start + self.slice_size
+
+        self.deliver(self.recipients[start:end])
+
+        if end >= len(self.recipients):
+            self.finish_pass()
+
+        self.schedule()
+
+    def deliver(self, sessions):
+        messages = self.messages
+        everyone = self.everyone
+        excluded = self.excluded
+
+        for sess in sessions:
+            if sess.closed:
+                continue
+
+            session_id = sess.session_id
+            message = everyone
+
+            if session_id in excluded:
+                to_send = [
+                    msg for msg, exclude, _ in messages
+                    if not (exclude and session_id in exclude)
+                ]
+
+                if not to_send:
+                    continue
+
+                message = merge(to_send)
+
+            sess.send(message)
+
+    def stop(self):
+        """
+        Abandon all queued broadcasts, resolving their futures.
+        """
+        if self.messages is not None:
+            self.finish_pass()
+
+        pending, self.pending = self.pending, []
+
+        for _, _, future in pending:
+            future.set_result(None)
@@ -0,0 +1,174 @@
+"""
+Shared state that is kept in sync with many sessions: a late joiner is sent
+a snapshot of the whole state, everyone is sent the changes as deltas.
+"""
+
+from tornado import ioloop
+
+from sockjs.tornado import proto
+
+
+__all__ = [
+    'StateChannel',
+]
+
+
+class StateChannel(object):
+    """
+    A keyed state map whose subscribers receive a snapshot on subscribing and
+    then every change, with no gap in between.
+
+    Changes made during one IOLoop iteration are published together as a
+    single delta, encoded once for all subscribers::
+
+        {"channel": <name>, "version": <n>, "set": {...}, "deleted": [...]}
+
+    New subscribers are sent the cached snapshot::
+
+        {"channel": <name>, "version": <n>, "state": {...}}
+
+    Each entry is encoded once per change and the snapshot is assembled from
+    the encoded entries, so the cost of a join does not grow with the number
+    of joins. Values must not be mutated in place once set.
+
+    :ivar name: The name of the channel.
+    :ivar state: The current state, a dict of str -> JSON encodable value.
+    :ivar version: The number of deltas published so far.
+    :ivar subscribers: The subscribed sessions.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.state = {}
+        self.version = 0
+        self.subscribers = set()
+
+        # key -> the encoded `"key":value` entry
+        self.entries = {}
+        self.changed = set()
+        self.publish_scheduled = False
+        self.snapshot_message = None
+
+        self.header = '{"channel":%s,"version":' % (proto.encode(name),)
+
+    def __len__(self):
+        return len(self.state)
+
+    def __contains__(self, key):
+        return key in self.state
+
+    def get(self, key, default=None):
+        return self.state.get(key, default)
+
+    def set(self, key, value):
+        self.state[key] = value
+
+        self.mark(key)
+
+    def update(self, values):
+        for key, value in values.items():
+            self.set(key, value)
+
+    def delete(self, key):
+        self.state.pop(key, None)
+
+        self.mark(key)
+
+    def mark(self, key):
+        self.changed.add(key)
+
+        if not self.publish_scheduled:
+            self.publish_scheduled = True
+
+            ioloop.IOLoop.current().add_callback(self.publish)
+
+    def publish(self):
+        """
+        Send the pending changes to the subscribers as one delta.
+        """
+        self.publish_scheduled = False
+
+        changed, self.changed = self.changed, set()
+
+        if not changed:
+            return
+
+        state = self.state
+        entries = self.entries
+
+        updated = []
+        deleted = []
+
+        for key in changed:
+            if key in state:
+                entry = entries[key] = '%s:%s' % (
+                    proto.encode(key),
+                    proto.encode(state[key]),
+                )
+
+                updated.append(entry)
+            elif entries.pop(key, None) is not None:
+                deleted.append(key)
+
+        if not updated and not deleted:
+            return
+
+        self.version += 1
+        self.snapshot_message = None
+
+        if not self.subscribers:
+            return
+
+        delta = proto.PreparedMessage(
+            '%s%d,"set":{%s},"deleted":%s}' % (
+                self.header,
+                self.version,
+                ','.join(updated),
+                proto.encode(deleted),
+            ),
+            raw=True,
+        )
+
+        for sess in list(self.subscribers):
+            if sess.closed:
+                self.subscribers.discard(sess)
+
+                continue
+
+            sess.send(delta)
+
+    @property
+    def snapshot(self):
+        """The :ref:`proto.PreparedMessage` with the full published state"""
+        message = self.snapshot_message
+
+        if message is None:
+            message = self.snapshot_message = proto.PreparedMessage(
+                '%s%d,"state":{%s}}' % (
+                    self.header,
+                    self.version,
+                    ','.join(self.entries.values()),
+                ),
+                raw=True,
+            )
+
+        return message
+
+    def subscribe(self, session):
+        """
+        Send `session` the snapshot and from then on every delta.
+        """
+        if session in self.subscribers:
+            return
+
+        # pending changes go out as a delta first, so that the snapshot is
+        # current and the session misses nothing
+        if self.changed:
+            self.publish()
+
+        session.send(self.snapshot)
+
+        self.subscribers.add(session)
+
+    def unsubscribe(self, session):
+        self.subscribers.discard(session)
@@ -0,0 +1,95 @@
+"""
+Graceful draining of an endpoint, spreading the disconnects (and so the
+reconnects of the clients to other nodes) over a period of time.
+"""
+
+import random
+
+from tornado import concurrent
+from tornado import ioloop
+
+
+__all__ = [
+    'Drainer',
+]
+
+
+class Drainer(object):
+    """
+    Closes the active sessions of an endpoint in equally sized batches, one
+    batch every `interval` seconds, so that all of them are closed after
+    `duration` seconds.
+
+    Each session is closed with `code` and a reason that tells the client how
+    long to wait before reconnecting: `reason` followed by
+    `; reconnect=<milliseconds>`, a random delay of up to `jitter` seconds.
+
+    :ivar future: Resolves once the endpoint has no active sessions left.
+    """
+
+    def __init__(self, endpoint, duration, interval, code, reason, jitter):
+        self.endpoint = endpoint
+        self.interval = interval
+        self.code = code
+        self.reason = reason
+        self.jitter = jitter
+
+        self.sessions = list(endpoint.active_sessions.values())
+
+        batches = max(int(duration / interval), 1)
+
+        # ceil, so that the last batch goes out within `duration`
+        self.batch_size = -(-len(self.sessions) // batches) or 1
+
+        self.future = concurrent.Future()
+        self.timeout = None
+
+    def start(self):
+        self.run()
+
+        return self.future
+
+    def run(self):
+        self.timeout = None
+
+        sessions = self.sessions
+
+        if not sessions:
+            # sessions that were still being opened when the drain started
+            sessions = self.sessions = list(
+                self.endpoint.active_sessions.values()
+            )
+
+        batch = sessions[-self.batch_size:]
+
+        del sessions[-self.batch_size:]
+
+        for sess in batch:
+            if not sess.closed:
+                sess.close(self.code, self.close_reason())
+
+        if not sessions and not self.endpoint.active_sessions:
+            self.finish()
+
+            return
+
+        self.timeout = ioloop.IOLoop.current().call_later(
+            self.interval,
+            self.run,
+        )
+
+    def close_reason(self):
+        delay = random.uniform(0, self.jitter)
+
+        return '%s; reconnect=%d' % (self.reason, delay * 1000)
+
+    def finish(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+    def stop(self):
+        if self.timeout is not None:
+            ioloop.IOLoop.current().remove_timeout(self.timeout)
+            self.timeout = None
+
+        self.finish()
@@ -93,7 +93,9 @@ class CookieMixin(object):
         cookie = self.cookies.get(self.COOKIE_NAME)
 
         if not cookie:
-            cv = 'dummy'
+            # identifies this process to sticky load balancers (see
+            # `sockjs.tornado.proxy`)
+            cv = self.sockjs_settings['node_id'] or 'dummy'
         else:
             cv = cookie.value
 
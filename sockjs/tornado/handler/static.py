@@ -149,4 +149,13 @@ class InfoHandler(base.BaseHandler):
             entropy=random.randint(0, self.MAX_ENTROPY),
         )
 
+        if not self.endpoint.accepting_sessions:
+            # sockjs-client falls back to the other transports without
+            # websocket, retry_after is a hint for custom clients and load
+            # balancers
+            settings = self.sockjs_settings
+
+            options['websocket'] = False
+            options['retry_after'] = settings['overload_retry_after']
+
         self.write(json_encode(options))
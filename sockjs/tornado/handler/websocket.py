@@ -1,3 +1,6 @@
+from tornado import escape
+from tornado import gen
+from tornado import iostream
 from tornado import websocket
 
 try:
@@ -39,6 +42,65 @@ class WebSocketHandler(websocket.WebSocketHandler):
 
         return origin in allow_origin
 
+    @gen.coroutine
+    def write_fragments(self, fragments, binary=False):
+        """
+        Write a single message as a sequence of websocket frames, one per
+        fragment (see RFC 6455 section 5.4), so that the whole message never
+        has to be held in memory. Each frame is written once the previous one
+        has reached the socket, a slow client holds up the next fragment
+        rather than having the message pile up in the write buffer.
+
+        The frames are never compressed, even if permessage-deflate has been
+        negotiated, tornado only compresses whole messages and RFC 7692 allows
+        uncompressed messages on a compressed connection. Versions of tornado
+        without the (private) `_write_frame` of tornado 5.x and 6.x get the
+        fragments joined and written as a single message.
+
+        :param fragments: An iterable of bytes/str fragments of the message.
+        :param binary: Whether the message is binary or text.
+        :returns: A future that resolves once the message has been written.
+        """
+        conn = self.ws_connection
+
+        if conn is None:
+            raise WebSocketClosedError()
+
+        write_frame = getattr(conn, '_write_frame', None)
+
+        if write_frame is None:
+            yield self.write_message(
+                b''.join(escape.utf8(f) for f in fragments),
+                binary=binary,
+            )
+
+            return
+
+        opcode = 0x2 if binary else 0x1
+        previous = None
+
+        try:
+            for fragment in fragments:
+                fragment = escape.utf8(fragment)
+
+                if not fragment:
+                    continue
+
+                if previous is not None:
+                    yield write_frame(False, opcode, previous)
+                    # all subsequent frames are continuations
+                    opcode = 0x0
+
+                if self.ws_connection is None:
+                    # closed while waiting on the socket
+                    raise WebSocketClosedError()
+
+                previous = fragment
+
+            yield write_frame(True, opcode, previous or b'')
+        except iostream.StreamClosedError:
+            raise WebSocketClosedError()
+
     def abort_connection(self):
         if self.ws_connection:
             self.ws_connection._abort()
@@ -0,0 +1,80 @@
+"""
+Recent message history, so that clients that reconnect can catch up on the
+broadcasts they missed.
+"""
+
+
+__all__ = [
+    'History',
+]
+
+
+class History(object):
+    """
+    A ring buffer of the last `size` messages broadcast on a topic.
+
+    Messages are :ref:`proto.PreparedMessage` instances with an `event_id`.
+    Ids are increasing but need not be contiguous, the ids of an endpoint are
+    shared by all of its topics.
+
+    :ivar count: The number of messages appended so far.
+    :ivar evicted_id: The id of the newest message that has been pushed out
+        of the buffer, 0 if none has been.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.messages = [None] * size
+
+        self.count = 0
+        self.evicted_id = 0
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    @property
+    def last_id(self):
+        """The id of the newest message, 0 if there is none"""
+        if not self.count:
+            return 0
+
+        return self.messages[(self.count - 1) % self.size].event_id
+
+    def append(self, message):
+        slot = self.count % self.size
+
+        evicted = self.messages[slot]
+
+        if evicted is not None:
+            self.evicted_id = evicted.event_id
+
+        self.messages[slot] = message
+        self.count += 1
+
+    def since(self, last_id):
+        """
+        Return the messages with an id greater than `last_id`, oldest first.
+
+        :returns: A list of messages, or `None` if some of the messages after
+            `last_id` have already been evicted.
+        """
+        if last_id < self.evicted_id:
+            return None
+
+        messages = self.messages
+        size = self.size
+
+        missed = []
+
+        # walk back from the newest, a client is usually only a few behind
+        for i in range(self.count - 1, self.count - 1 - len(self), -1):
+            message = messages[i % size]
+
+            if message.event_id <= last_id:
+                break
+
+            missed.append(message)
+
+        missed.reverse()
+
+        return missed
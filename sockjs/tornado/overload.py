@@ -0,0 +1,135 @@
+"""
+Load shedding for endpoints whose IOLoop cannot keep up.
+"""
+
+from tornado import ioloop
+
+from sockjs.tornado.log import core as LOG
+
+
+__all__ = [
+    'NORMAL',
+    'ELEVATED',
+    'CRITICAL',
+    'OverloadController',
+]
+
+# Overload levels
+# the IOLoop keeps up
+NORMAL = 0
+# the IOLoop is lagging, shed optional work
+ELEVATED = 1
+# the IOLoop is badly lagging or the endpoint is full, stop taking on new
+# sessions
+CRITICAL = 2
+
+
+class OverloadController(object):
+    """
+    Measures how late the IOLoop runs a callback scheduled every `interval`
+    seconds and, together with the number of active sessions, derives the
+    overload level of an endpoint. `Endpoint.on_overload` is called whenever
+    the level changes.
+
+    A level is entered as soon as one of its thresholds is reached and only
+    left once all of its measures are below `recovery_ratio` times their
+    thresholds, so that the level does not flap.
+
+    :ivar lag_thresholds: The smoothed lag in seconds at which `ELEVATED` and
+        `CRITICAL` are entered.
+    :ivar max_sessions: The number of active sessions at which `CRITICAL` is
+        entered, 0 to ignore the number of sessions.
+    :ivar level: The current overload level.
+    :ivar lag: The smoothed IOLoop lag in seconds.
+    :cvar lag_alpha: The weight of each new lag sample in `lag`.
+    """
+
+    lag_alpha = 0.3
+
+    def __init__(self, endpoint, interval, lag_thresholds, max_sessions=0,
+                 recovery_ratio=0.5, stats=None):
+        self.endpoint = endpoint
+        self.interval = interval
+        self.lag_thresholds = lag_thresholds
+        self.max_sessions = max_sessions
+        self.recovery_ratio = recovery_ratio
+        self.stats = stats
+
+        self.level = NORMAL
+        self.lag = 0.0
+
+        self.expected = None
+        self.timeout = None
+
+    def start(self):
+        if self.timeout is None:
+            self.schedule()
+
+    def stop(self):
+        if self.timeout is not None:
+            ioloop.IOLoop.current().remove_timeout(self.timeout)
+            self.timeout = None
+
+    def schedule(self):
+        io_loop = ioloop.IOLoop.current()
+
+        self.expected = io_loop.time() + self.interval
+        self.timeout = io_loop.call_at(self.expected, self.check)
+
+    def check(self):
+        sample = max(ioloop.IOLoop.current().time() - self.expected, 0)
+
+        self.lag += self.lag_alpha * (sample - self.lag)
+
+        level = self.evaluate(self.lag, len(self.endpoint.active_sessions))
+
+        if self.stats:
+            self.stats.on_overload(level, self.lag)
+
+        if level != self.level:
+            LOG.warning(
+                'Overload level %d -> %d (lag %.3fs)',
+                self.level,
+                level,
+                self.lag,
+            )
+
+            self.level = level
+
+            self.endpoint.on_overload(level)
+
+        self.schedule()
+
+    def evaluate(self, lag, sessions):
+        """
+        Return the overload level for the measured `lag` and number of
+        `sessions`.
+        """
+        level = self.level
+
+        # escalate straight to the highest level reached
+        for target in (CRITICAL, ELEVATED):
+            if target <= level:
+                break
+
+            if self.pressure(target, lag, sessions) >= 1:
+                return target
+
+        # step down one level at a time
+        if level > NORMAL:
+            if self.pressure(level, lag, sessions) < self.recovery_ratio:
+                return level - 1
+
+        return level
+
+    def pressure(self, level, lag, sessions):
+        """
+        Return the highest ratio of a measure to its threshold for `level`.
+        1 or more means that the level has been reached.
+        """
+        ratio = lag / self.lag_thresholds[level - 1]
+
+        if level == CRITICAL and self.max_sessions:
+            ratio = max(ratio, sessions / float(self.max_sessions))
+
+        return ratio
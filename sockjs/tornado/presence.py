@@ -0,0 +1,206 @@
+"""
+Presence tracking: who is in which room, with the joins and leaves of each
+room announced to its members in coalesced batches.
+"""
+
+from tornado import ioloop
+
+from sockjs.tornado import proto
+
+
+__all__ = [
+    'Room',
+    'Presence',
+]
+
+
+class Room(object):
+    """
+    The members of a room.
+
+    :ivar members: A dict of member id -> set of the member's sessions. A
+        member is present while it has at least one session in the room.
+    :ivar sessions: All the sessions in the room.
+    :ivar announced: The member ids the sessions were last told about.
+    :ivar changed: The member ids that joined or left since the last
+        announcement.
+    """
+
+    __slots__ = ('name', 'members', 'sessions', 'announced', 'changed')
+
+    def __init__(self, name):
+        self.name = name
+        self.members = {}
+        self.sessions = set()
+        self.announced = set()
+        self.changed = set()
+
+    def __len__(self):
+        return len(self.members)
+
+
+class Presence(object):
+    """
+    Tracks the members of rooms. Every `interval` seconds at most, the
+    sessions of each room that changed are sent a single message with the
+    net changes::
+
+        {"presence": <room>, "joined": [...], "left": [...], "count": <n>}
+
+    A member that joins and leaves again between two announcements is not
+    announced at all, so reconnect storms cost one message per session and
+    interval instead of one per session and join.
+
+    :ivar rooms: A dict of room name -> :ref:`Room`.
+    :ivar dirty: The rooms with unannounced changes.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+
+        self.rooms = {}
+        # session -> {room name: member id}
+        self.session_rooms = {}
+        self.dirty = set()
+        self.timeout = None
+
+    def count(self, room):
+        """
+        Return the number of members in `room`.
+        """
+        members = self.rooms.get(room)
+
+        return len(members) if members else 0
+
+    def members(self, room):
+        """
+        Return the ids of the members in `room`.
+        """
+        members = self.rooms.get(room)
+
+        return list(members.members) if members else []
+
+    def join(self, room, session, member=None):
+        """
+        Add `session` to `room` as `member`, by default its session id.
+        """
+        if member is None:
+            member = session.session_id
+
+        joined = self.session_rooms.setdefault(session, {})
+
+        if room in joined:
+            return
+
+        joined[room] = member
+
+        members = self.rooms.get(room)
+
+        if members is None:
+            members = self.rooms[room] = Room(room)
+
+        members.sessions.add(session)
+
+        sessions = members.members.get(member)
+
+        if sessions is None:
+            sessions = members.members[member] = set()
+
+            self.mark(members, member)
+
+        sessions.add(session)
+
+    def leave(self, room, session):
+        """
+        Remove `session` from `room`.
+        """
+        joined = self.session_rooms.get(session)
+
+        if not joined or room not in joined:
+            return
+
+        member = joined.pop(room)
+
+        if not joined:
+            del self.session_rooms[session]
+
+        members = self.rooms[room]
+        members.sessions.discard(session)
+
+        sessions = members.members[member]
+        sessions.discard(session)
+
+        if not sessions:
+            del members.members[member]
+
+            self.mark(members, member)
+
+    def leave_all(self, session):
+        """
+        Remove `session` from every room it is in.
+        """
+        for room in list(self.session_rooms.get(session, ())):
+            self.leave(room, session)
+
+    def mark(self, room, member):
+        room.changed.add(member)
+
+        self.dirty.add(room)
+
+        if self.timeout is None:
+            self.timeout = ioloop.IOLoop.current().call_later(
+                self.interval,
+                self.announce,
+            )
+
+    def announce(self):
+        """
+        Send the net changes of every changed room to its sessions.
+        """
+        self.timeout = None
+
+        dirty, self.dirty = self.dirty, set()
+
+        for room in dirty:
+            members = room.members
+            announced = room.announced
+
+            joined = []
+            left = []
+
+            for member in room.changed:
+                if member in members:
+                    if member not in announced:
+                        announced.add(member)
+                        joined.append(member)
+                elif member in announced:
+                    announced.discard(member)
+                    left.append(member)
+
+            room.changed = set()
+
+            if not room.sessions:
+                # nobody left to tell
+                if not members:
+                    self.rooms.pop(room.name, None)
+
+                continue
+
+            if not joined and not left:
+                continue
+
+            message = proto.PreparedMessage({
+                'presence': room.name,
+                'joined': joined,
+                'left': left,
+                'count': len(members),
+            })
+
+            for sess in room.sessions:
+                if not sess.closed:
+                    sess.send(message)
+
+    def stop(self):
+        if self.timeout is not None:
+            ioloop.IOLoop.current().remove_timeout(self.timeout)
+            self.timeout = None
@@ -2,7 +2,10 @@
 SockJS protocol related functions
 """
 
-from sockjs.tornado.util import json_encode, json_decode
+import base64
+import re
+
+from sockjs.tornado.util import bytes_to_str, json_encode, json_decode
 
 # Protocol handlers
 OPEN = 'o'
@@ -10,6 +13,47 @@ DISCONNECT = 'c'
 MESSAGE = 'm'
 HEARTBEAT = 'h'
 
+# strict JSON (RFC 8259), NaN, Infinity and the other literals that
+# json.loads lets through are not matched
+JSON_WHITESPACE = ' \t\n\r'
+
+_WS = r'[ \t\n\r]*'
+_STRING = (r'"[^"\\\x00-\x1f]*'
+           r'(?:\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4})[^"\\\x00-\x1f]*)*"')
+_SCALAR = (_STRING + r'|-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?'
+           r'|true|false|null')
+
+
+def _containers(value):
+    # the objects and lists whose members are matched by `value`
+    member = _STRING + _WS + ':' + _WS + '(?:' + value + ')' + _WS
+    item = '(?:' + value + ')' + _WS
+
+    return (
+        r'\{' + _WS + '(?:' + member + '(?:,' + _WS + member + ')*)?\\}|'
+        r'\[' + _WS + '(?:' + item + '(?:,' + _WS + item + ')*)?\\]'
+    )
+
+
+# containers nested up to 3 deep are matched whole by the regex engine, which
+# covers most messages. Deeper ones are validated token by token.
+_NESTED = _containers(
+    _SCALAR + '|' + _containers(_SCALAR + '|' + _containers(_SCALAR))
+)
+
+# the groups are 1: a whole container, 2: a scalar, 3: a structural character
+FRAME_TOKEN = re.compile(
+    _WS + '(?:(' + _NESTED + ')|(' + _SCALAR + r')|([\[\]{},:]))'
+)
+# a whole message of a frame and the `,` or `]` after it
+FRAME_MESSAGE = re.compile(
+    _WS + '(' + _NESTED + '|' + _SCALAR + ')' + _WS + r'([,\]])'
+)
+FRAME_SEPARATOR = re.compile(_WS + r'([,\]])')
+
+# what `scan_value` expects next
+_VALUE, _VALUE_OR_CLOSE, _KEY, _KEY_OR_CLOSE, _COLON, _NEXT = range(6)
+
 
 def close_frame(code, reason):
     """Return SockJS packet with code and close reason
@@ -22,5 +66,255 @@ def close_frame(code, reason):
     return 'c[%d,"%s"]' % (code, reason)
 
 
+def encode_binary(data):
+    """Return the fallback encoding of a binary message for transports that
+    can only carry text - a JSON string of the base64 encoded bytes.
+
+    `data`
+        Message bytes
+    """
+    return json_encode(base64.b64encode(data).decode('ascii'))
+
+
+def scan_value(data, pos):
+    """Validate the strict JSON value that starts at `pos` in `data` without
+    decoding it. Returns the position after the value, raises `ValueError` if
+    it is not valid.
+
+    `data`
+        JSON text
+    `pos`
+        Where the value starts, leading whitespace is skipped
+    """
+    match = FRAME_TOKEN.match
+    stack = []
+    expect = _VALUE
+
+    while True:
+        token = match(data, pos)
+
+        if token is None:
+            raise ValueError('Invalid JSON at %d' % (pos,))
+
+        pos = token.end()
+        kind = token.lastindex
+
+        if expect == _NEXT:
+            char = token.group(3)
+
+            if char == ',':
+                expect = _VALUE if stack[-1] == '[' else _KEY
+
+                continue
+
+            if char != (']' if stack[-1] == '[' else '}'):
+                raise ValueError('Invalid JSON at %d' % (token.start(),))
+
+            stack.pop()
+        elif expect == _COLON:
+            if token.group(3) != ':':
+                raise ValueError('Invalid JSON at %d' % (token.start(),))
+
+            expect = _VALUE
+
+            continue
+        elif expect >= _KEY:
+            if kind == 2 and token.group(2)[0] == '"':
+                expect = _COLON
+
+                continue
+
+            if expect != _KEY_OR_CLOSE or token.group(3) != '}':
+                raise ValueError('Invalid JSON at %d' % (token.start(),))
+
+            stack.pop()
+        elif kind == 3:
+            char = token.group(3)
+
+            if char == '[':
+                stack.append(char)
+                expect = _VALUE_OR_CLOSE
+
+                continue
+
+            if char == '{':
+                stack.append(char)
+                expect = _KEY_OR_CLOSE
+
+                continue
+
+            if expect != _VALUE_OR_CLOSE or char != ']':
+                raise ValueError('Invalid JSON at %d' % (token.start(),))
+
+            stack.pop()
+
+        # a value is complete
+        if not stack:
+            return pos
+
+        expect = _NEXT
+
+
+def split_frame(data):
+    """Split the text of a JSON encoded list of messages into the JSON text of
+    each message, so that they can be relayed without being decoded and
+    re-encoded. A frame that is not a list is a single message. Raises
+    `ValueError` if the frame is malformed.
+
+    Every message is validated as strict JSON by `scan_value` (`NaN`,
+    `Infinity` and the like are rejected), so its text is safe to relay to
+    other clients.
+
+    `data`
+        JSON text of the frame
+    """
+    data = data.strip(JSON_WHITESPACE)
+    size = len(data)
+
+    if not data.startswith('['):
+        if scan_value(data, 0) != size:
+            raise ValueError('Trailing data after frame')
+
+        return [data]
+
+    messages = []
+
+    if data[1:].lstrip(JSON_WHITESPACE) == ']':
+        return messages
+
+    pos = 1
+    match = FRAME_MESSAGE.match
+    separator = FRAME_SEPARATOR.match
+
+    while True:
+        token = match(data, pos)
+
+        if token is not None:
+            messages.append(token.group(1))
+        else:
+            # nested too deep for FRAME_MESSAGE, or invalid
+            end = scan_value(data, pos)
+
+            messages.append(data[pos:end].lstrip(JSON_WHITESPACE))
+
+            token = separator(data, end)
+
+            if token is None:
+                raise ValueError('Invalid frame at %d' % (end,))
+
+        pos = token.end()
+
+        if token.group(token.lastindex) == ']':
+            break
+
+    if pos != size:
+        raise ValueError('Trailing data after frame')
+
+    return messages
+
+
+class PreparedMessage(object):
+    """An immutable message that is encoded once and sent to many sessions.
+
+    The JSON text is encoded up front. The transport frames are built on first
+    use and memoized, so every subsequent send over the same kind of transport
+    writes the same bytes.
+
+    `message`
+        The message, any JSON encodable object
+    `raw`
+        Whether `message` is already JSON encoded
+    `event_id`
+        The id of the message in the endpoint history, if it was recorded
+    """
+
+    __slots__ = ('_data', '_frames', '_event_id')
+
+    def __init__(self, message, raw=False, event_id=None):
+        if not raw:
+            message = json_encode(message)
+
+        object.__setattr__(self, '_data', bytes_to_str(message))
+        object.__setattr__(self, '_frames', {})
+        object.__setattr__(self, '_event_id', event_id)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('PreparedMessage is immutable')
+
+    def __repr__(self):
+        return '<PreparedMessage %r>' % (self._data,)
+
+    @property
+    def data(self):
+        """The JSON text of the message"""
+        return self._data
+
+    @property
+    def event_id(self):
+        """The history id of the message or `None`"""
+        return self._event_id
+
+    @property
+    def messages(self):
+        """The messages sent, one unless this is a :ref:`PreparedBatch`"""
+        return (self,)
+
+    @property
+    def frame(self):
+        """The SockJS frame of the message"""
+        return self.get_frame(None, lambda data: 'a[' + data + ']')
+
+    def get_frame(self, key, encode):
+        """Return the frame memoized under `key`, calling `encode` with the
+        JSON text to build it on first use.
+
+        `key`
+            Identifies the encoding, e.g. the transport name
+        `encode`
+            Callable returning the encoded frame
+        """
+        frames = self._frames
+
+        try:
+            return frames[key]
+        except KeyError:
+            frame = frames[key] = encode(self._data)
+
+            return frame
+
+
+class PreparedBatch(PreparedMessage):
+    """Several :ref:`PreparedMessage` sent together in a single frame.
+
+    The JSON text is that of the messages joined by commas, so the frame
+    built by every SockJS transport carries them all. Transports that have no
+    frames send `messages` one by one.
+
+    `messages`
+        The :ref:`PreparedMessage` instances, in order
+    """
+
+    __slots__ = ('_messages',)
+
+    def __init__(self, messages):
+        event_ids = [msg.event_id for msg in messages if msg.event_id]
+
+        super(PreparedBatch, self).__init__(
+            ','.join(msg.data for msg in messages),
+            raw=True,
+            event_id=max(event_ids) if event_ids else None,
+        )
+
+        object.__setattr__(self, '_messages', tuple(messages))
+
+    def __repr__(self):
+        return '<PreparedBatch of %d>' % (len(self._messages),)
+
+    @property
+    def messages(self):
+        """The messages in the batch"""
+        return self._messages
+
+
 encode = json_encode
 decode = json_decode
@@ -0,0 +1,356 @@
+"""
+A front proxy that spreads SockJS sessions over several sockjs-tornado
+processes without an external sticky load balancer.
+
+Every request for a session is routed to the same backend by consistent
+hashing on the session id in the url, so adding or removing a backend only
+moves the sessions of its share of the ring. Requests that carry no session
+id (e.g. /info) are routed by the JSESSIONID cookie if it names a known
+backend (see the `node_id` setting), otherwise by client ip.
+
+Usage::
+
+    app = ProxyApplication({
+        'a': 'http://127.0.0.1:8081',
+        'b': 'http://127.0.0.1:8082',
+    })
+    app.listen(8080)
+"""
+
+from bisect import bisect
+import hashlib
+import re
+
+from tornado import gen
+from tornado import httputil
+from tornado import web
+from tornado import websocket
+from tornado.httpclient import HTTPRequest
+
+try:
+    # keeps upstream connections alive between requests
+    from tornado.curl_httpclient import CurlAsyncHTTPClient as HTTPClient
+except ImportError:
+    from tornado.simple_httpclient import SimpleAsyncHTTPClient as HTTPClient
+
+from sockjs.tornado.handler.base import CookieMixin
+from sockjs.tornado.log import handler as LOG
+from sockjs.tornado.urls import SESSION_PREFIX_URL
+
+
+__all__ = [
+    'HashRing',
+    'Router',
+    'ProxyHandler',
+    'ProxyWebSocketHandler',
+    'ProxyApplication',
+]
+
+
+SESSION_URL = re.compile(SESSION_PREFIX_URL + r'/[^/.]+$')
+
+# headers that only apply to a single connection
+HOP_BY_HOP = frozenset([
+    'Connection',
+    'Keep-Alive',
+    'Proxy-Authenticate',
+    'Proxy-Authorization',
+    'Te',
+    'Trailer',
+    'Transfer-Encoding',
+    'Upgrade',
+])
+
+# polling and streaming responses are long lived but bounded by the backend
+# (heartbeats and `response_limit`). Some tornado versions do not send the
+# request at all with no timeout.
+UPSTREAM_TIMEOUT = 3600
+
+# headers passed on to the backend when opening a websocket
+WEBSOCKET_HEADERS = ('Origin', 'Cookie', 'User-Agent')
+
+
+class UpstreamAborted(Exception):
+    """
+    Raised from the upstream callbacks once the client has gone away, which
+    makes the http client abort the upstream request.
+    """
+
+
+def hash_key(key):
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:8], 16)
+
+
+class HashRing(object):
+    """
+    A consistent hash ring.
+
+    :ivar replicas: The number of points of each node on the ring, more
+        points spread the keys more evenly.
+    """
+
+    def __init__(self, nodes=(), replicas=160):
+        self.replicas = replicas
+
+        self.keys = []
+        self.points = {}
+
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        for i in range(self.replicas):
+            self.points[hash_key('%s-%d' % (node, i))] = node
+
+        self.keys = sorted(self.points)
+
+    def remove(self, node):
+        for i in range(self.replicas):
+            self.points.pop(hash_key('%s-%d' % (node, i)), None)
+
+        self.keys = sorted(self.points)
+
+    def get(self, key):
+        """
+        Return the node that `key` maps to.
+        """
+        if not self.keys:
+            raise LookupError('No nodes in the ring')
+
+        idx = bisect(self.keys, hash_key(key)) % len(self.keys)
+
+        return self.points[self.keys[idx]]
+
+
+class Router(object):
+    """
+    Maps requests to backends.
+
+    :ivar backends: A dict of node_id -> base url of the backend (e.g.
+        `http://127.0.0.1:8081`).
+    """
+
+    def __init__(self, backends, replicas=160):
+        self.backends = dict(backends)
+        self.ring = HashRing(self.backends, replicas=replicas)
+
+    def add(self, node_id, url):
+        self.backends[node_id] = url
+        self.ring.add(node_id)
+
+    def remove(self, node_id):
+        self.ring.remove(node_id)
+        self.backends.pop(node_id, None)
+
+    def route(self, request):
+        """
+        Return the base url of the backend for a tornado request.
+        """
+        match = SESSION_URL.search(request.path)
+
+        if match:
+            return self.backends[self.ring.get(match.group('session_id'))]
+
+        cookie = request.cookies.get(CookieMixin.COOKIE_NAME)
+
+        if cookie and cookie.value in self.backends:
+            return self.backends[cookie.value]
+
+        return self.backends[self.ring.get(request.remote_ip)]
+
+
+class ProxyHandler(web.RequestHandler):
+    """
+    Forwards a request to its backend and streams the response back as it
+    arrives, so that streaming transports keep working.
+    """
+
+    SUPPORTED_METHODS = ('GET', 'POST', 'OPTIONS')
+
+    def initialize(self, router, client):
+        self.router = router
+        self.client = client
+
+        self.upstream_headers = None
+        self.upstream_closed = False
+
+    def set_default_headers(self):
+        # all headers come from the backend
+        self.clear_header('Content-Type')
+        self.clear_header('Server')
+        self.clear_header('Date')
+
+    @gen.coroutine
+    def forward(self):
+        request = self.request
+        headers = httputil.HTTPHeaders()
+
+        for name, value in request.headers.get_all():
+            if name not in HOP_BY_HOP:
+                headers.add(name, value)
+
+        headers['X-Real-Ip'] = request.remote_ip
+        headers.add('X-Forwarded-For', request.remote_ip)
+
+        upstream = HTTPRequest(
+            self.router.route(request) + request.uri,
+            method=request.method,
+            headers=headers,
+            body=request.body if request.method == 'POST' else None,
+            follow_redirects=False,
+            decompress_response=False,
+            request_timeout=UPSTREAM_TIMEOUT,
+            header_callback=self.on_upstream_header,
+            streaming_callback=self.on_upstream_chunk,
+        )
+
+        response = yield self.client.fetch(upstream, raise_error=False)
+
+        if self.upstream_closed:
+            return
+
+        if response.code == 599 and self.upstream_headers is None:
+            LOG.error('Upstream %s failed: %r', upstream.url, response.error)
+
+            self.set_status(502)
+
+        self.finish()
+
+    get = post = options = forward
+
+    def on_upstream_header(self, line):
+        if self.upstream_closed:
+            raise UpstreamAborted()
+
+        line = line.rstrip('\r\n')
+
+        if line.startswith('HTTP/'):
+            start = httputil.parse_response_start_line(line)
+
+            # interim (e.g. 100 Continue) responses are not passed on
+            self.upstream_headers = None
+
+            if start.code >= 200:
+                self.upstream_headers = httputil.HTTPHeaders()
+                self.set_status(start.code, start.reason)
+
+            return
+
+        if self.upstream_headers is None:
+            return
+
+        if line:
+            self.upstream_headers.parse_line(line)
+
+            return
+
+        for name, value in self.upstream_headers.get_all():
+            if name not in HOP_BY_HOP:
+                self.add_header(name, value)
+
+    def on_upstream_chunk(self, chunk):
+        if self.upstream_closed:
+            raise UpstreamAborted()
+
+        self.write(chunk)
+        self.flush()
+
+    def on_connection_close(self):
+        # the upstream request is aborted as soon as it sends anything else,
+        # at the latest with the next heartbeat of a streaming response
+        self.upstream_closed = True
+
+
+class ProxyWebSocketHandler(websocket.WebSocketHandler):
+    """
+    Passes a websocket through to its backend, frame by frame.
+    """
+
+    def initialize(self, router):
+        self.router = router
+        self.upstream = None
+
+    def check_origin(self, origin):
+        # the backend checks the origin
+        return True
+
+    @gen.coroutine
+    def open(self, *args, **kwargs):
+        request = self.request
+        url = 'ws' + self.router.route(request)[4:] + request.uri
+
+        headers = httputil.HTTPHeaders()
+
+        for name in WEBSOCKET_HEADERS:
+            if name in request.headers:
+                headers[name] = request.headers[name]
+
+        headers['X-Real-Ip'] = request.remote_ip
+        headers['X-Forwarded-For'] = request.remote_ip
+
+        try:
+            # on_message is not called before open has completed
+            self.upstream = yield websocket.websocket_connect(
+                HTTPRequest(url, headers=headers),
+                on_message_callback=self.on_upstream_message,
+            )
+        except Exception:
+            LOG.exception('Failed to connect upstream %s', url)
+
+            self.close(1011, 'Upstream unavailable')
+
+    def on_message(self, message):
+        if self.upstream:
+            self.upstream.write_message(
+                message,
+                binary=isinstance(message, bytes),
+            )
+
+    def on_upstream_message(self, message):
+        if message is None:
+            upstream = self.upstream
+
+            if upstream:
+                self.close(upstream.close_code, upstream.close_reason)
+
+            return
+
+        try:
+            self.write_message(message, binary=isinstance(message, bytes))
+        except websocket.WebSocketClosedError:
+            pass
+
+    def on_close(self):
+        upstream, self.upstream = self.upstream, None
+
+        if upstream:
+            upstream.close(self.close_code, self.close_reason)
+
+
+class ProxyApplication(web.Application):
+    """
+    A tornado application that proxies all requests to the backends.
+
+    :param backends: A dict of node_id -> base url of the backend. Set the
+        `node_id` setting of each backend to its key so that the JSESSIONID
+        cookie identifies it.
+    :param max_clients: The max number of concurrent upstream requests. Every
+        polling and streaming client holds one while its request is open.
+    """
+
+    def __init__(self, backends, max_clients=10000, replicas=160,
+                 **settings):
+        self.router = Router(backends, replicas=replicas)
+        self.client = HTTPClient(force_instance=True, max_clients=max_clients)
+
+        handlers = [
+            (r'.*/websocket$', ProxyWebSocketHandler, dict(
+                router=self.router,
+            )),
+            (r'.*', ProxyHandler, dict(
+                router=self.router,
+                client=self.client,
+            )),
+        ]
+
+        super(ProxyApplication, self).__init__(handlers, **settings)
@@ -0,0 +1,192 @@
+"""
+Resource quotas, so that one tenant (an endpoint, or a group of endpoints
+sharing a quota) cannot exhaust the resources of the others.
+"""
+
+import time
+
+
+__all__ = [
+    'Quota',
+]
+
+
+class Quota(object):
+    """
+    Limits the resources used by the endpoints it is set on (see the `quota`
+    setting). Pass the same instance to several endpoints to limit them as a
+    group. Every limit defaults to 0, unlimited.
+
+    - `max_sessions`: new sessions are refused once it is reached.
+    - `max_buffered_bytes`: messages that would take the session buffers
+      over it (in utf-8 bytes) are dropped.
+    - `inbound_rate`: messages per second received from the clients, the
+      messages above it are dropped.
+    - `outbound_rate`: messages per second sent to the clients, the messages
+      above it are dropped. :ref:`proto.PreparedMessage` sends (broadcasts,
+      history replays, state channel and presence updates) are counted but
+      never dropped, the state of the clients would go out of sync.
+    - `broadcast_rate`: recipients of broadcasts per second, broadcasts that
+      would go over it are dropped. The first broadcast of a second is always
+      let through, however many recipients it has, so that a broadcast to
+      more than `broadcast_rate` sessions is not dropped forever.
+
+    Rates are counted over whole seconds.
+
+    :ivar sessions: The number of sessions.
+    :ivar buffered_bytes: The number of bytes in the session buffers.
+    """
+
+    def __init__(self, max_sessions=0, max_buffered_bytes=0, inbound_rate=0,
+                 outbound_rate=0, broadcast_rate=0, name=None,
+                 time_func=None):
+        self.max_sessions = max_sessions
+        self.max_buffered_bytes = max_buffered_bytes
+        self.inbound_rate = inbound_rate
+        self.outbound_rate = outbound_rate
+        self.broadcast_rate = broadcast_rate
+        self.name = name
+        self.time_func = time_func or time.time
+
+        self.sessions = 0
+        self.buffered_bytes = 0
+
+        # counts of the current second
+        self.second = 0
+        self.inbound = 0
+        self.outbound = 0
+        self.fanout = 0
+
+        self.buffer_dropped = 0
+        self.inbound_dropped = 0
+        self.outbound_dropped = 0
+        self.broadcasts_dropped = 0
+
+    def __repr__(self):
+        return '<Quota %s>' % (self.name,)
+
+    @property
+    def sessions_available(self):
+        return not self.max_sessions or self.sessions < self.max_sessions
+
+    def add_session(self):
+        self.sessions += 1
+
+    def remove_session(self):
+        self.sessions -= 1
+
+    def reserve_buffer(self, size):
+        """
+        Account for `size` more bytes in the session buffers.
+
+        :returns: `False` if they do not fit.
+        """
+        limit = self.max_buffered_bytes
+
+        if limit and size > 0 and self.buffered_bytes + size > limit:
+            self.buffer_dropped += 1
+
+            return False
+
+        self.buffered_bytes += size
+
+        return True
+
+    def release_buffer(self, size):
+        self.buffered_bytes -= size
+
+    def tick(self):
+        second = int(self.time_func())
+
+        if second != self.second:
+            self.second = second
+            self.inbound = self.outbound = self.fanout = 0
+
+    def allow_inbound(self, count):
+        """
+        Account for `count` messages received from a client.
+
+        :returns: `False` if they are over the rate and must be dropped.
+        """
+        if not self.inbound_rate:
+            return True
+
+        self.tick()
+
+        if self.inbound + count > self.inbound_rate:
+            self.inbound_dropped += count
+
+            return False
+
+        self.inbound += count
+
+        return True
+
+    def allow_outbound(self, count=1):
+        """
+        Account for `count` messages sent to a client.
+
+        :returns: `False` if they are over the rate and must be dropped.
+        """
+        if not self.outbound_rate:
+            return True
+
+        self.tick()
+
+        if self.outbound + count > self.outbound_rate:
+            self.outbound_dropped += count
+
+            return False
+
+        self.outbound += count
+
+        return True
+
+    def count_outbound(self, count=1):
+        """
+        Account for `count` messages sent to a client that must not be
+        dropped.
+        """
+        if not self.outbound_rate:
+            return
+
+        self.tick()
+
+        self.outbound += count
+
+    def allow_broadcast(self, recipients):
+        """
+        Account for a broadcast to `recipients` sessions. The first broadcast
+        of a second is always allowed.
+
+        :returns: `False` if it is over the rate and must be dropped.
+        """
+        if not self.broadcast_rate:
+            return True
+
+        self.tick()
+
+        if self.fanout and self.fanout + recipients > self.broadcast_rate:
+            self.broadcasts_dropped += 1
+
+            return False
+
+        self.fanout += recipients
+
+        return True
+
+    def usage(self):
+        """Return a dict with the current usage of the quota"""
+        self.tick()
+
+        return dict(
+            sessions=self.sessions,
+            buffered_bytes=self.buffered_bytes,
+            inbound_ps=self.inbound,
+            outbound_ps=self.outbound,
+            broadcast_ps=self.fanout,
+            buffer_dropped=self.buffer_dropped,
+            inbound_dropped=self.inbound_dropped,
+            outbound_dropped=self.outbound_dropped,
+            broadcasts_dropped=self.broadcasts_dropped,
+        )
@@ -1,5 +1,22 @@
+import time
+
+from tornado import concurrent
+from tornado import gen
+from tornado import ioloop
+
+from sockjs.tornado import batch
+from sockjs.tornado import broadcast
+from sockjs.tornado import channel
+from sockjs.tornado import drain
+from sockjs.tornado import history
+from sockjs.tornado.log import core as LOG
+from sockjs.tornado import overload
+from sockjs.tornado import presence
+from sockjs.tornado import proto
 from sockjs.tornado import session
+from sockjs.tornado import shaper
 from sockjs.tornado import stats
+from sockjs.tornado import timer
 from sockjs.tornado import urls
 from sockjs.tornado import web
 
@@ -19,6 +36,15 @@ DEFAULT_SETTINGS = {
     # After a heartbeat has been sent, how long in seconds to wait until a
     # response before disconnecting the session
     'heartbeat_timeout': 5,
+    # How websocket sessions are kept alive. Polling and streaming transports
+    # always get `h` frames.
+    #  - 'auto': protocol pings, plus `h` frames until the client has answered
+    #    its first ping.
+    #  - 'ping': protocol pings only.
+    #  - 'frame': `h` frames only. Dead peers are then only noticed when the
+    #    TCP connection closes.
+    # Raw websockets always use protocol pings.
+    'heartbeat_strategy': 'auto',
     # Max wait time in seconds after a session has been closed (specifically
     # put in the CLOSING state) before reaping the session. This allows polling
     # transports to reconnect and get the close frame. Websocket transports do
@@ -32,6 +58,9 @@ DEFAULT_SETTINGS = {
     'response_limit': 128 * 1024,
     # Enable or disable JSESSIONID cookie handling
     'cookie_affinity': True,
+    # The value of the JSESSIONID cookie set for new clients, identifying this
+    # process to sticky load balancers. Defaults to 'dummy'.
+    'node_id': None,
     # Should sockjs-tornado flush messages immediately or queue then and
     # flush on next ioloop tick
     'immediate_flush': True,
@@ -43,6 +72,143 @@ DEFAULT_SETTINGS = {
     # list of allowed origins for websocket connections
     # or "*" - accept all websocket connections
     'websocket_allow_origin': "*",
+    # Deliver binary messages as binary frames over the SockJS websocket
+    # transport. sockjs-client only understands text frames so leave this off
+    # unless all clients are custom. Binary messages are base64 encoded JSON
+    # strings when this is off and for all other transports. Raw websockets
+    # always use binary frames.
+    'websocket_binary': False,
+    # If set, raw websocket messages buffered while a write is in progress are
+    # coalesced into a single frame joined by this string (e.g. '\n').
+    # Otherwise each message is written as its own frame.
+    'raw_websocket_delimiter': None,
+    # Deliver each inbound message to the connection as its raw JSON text,
+    # validated as strict JSON and sliced out of the frame without being
+    # decoded (see examples/bench/frames.py). Pair with
+    # `broadcast(message, raw=True)` to relay messages without re-encoding
+    # them. Raw websocket messages are plain text and are never JSON text.
+    'raw_passthrough': False,
+    # Max number of messages dispatched to a connection per IOLoop iteration.
+    # Larger frames are dispatched over several iterations so that one busy
+    # session cannot starve all the others. 0 is unlimited.
+    'dispatch_budget': 0,
+    # Max number of seconds spent dispatching messages to a connection per
+    # IOLoop iteration. 0 is unlimited. The clock is checked between chunks
+    # of up to 64 messages, so the budget may be overrun by one chunk.
+    'dispatch_time_budget': 0,
+    # Max number of messages buffered per session while no transport is
+    # attached (or the session is slow). The oldest are dropped to make room.
+    # 0 is unlimited.
+    'send_buffer_limit': 0,
+    # Same as `send_buffer_limit`, for messages sent with high priority.
+    'priority_buffer_limit': 0,
+    # If a session's transport has more than this many bytes waiting to be
+    # sent on the socket after a write, the session is considered slow and
+    # `Endpoint.session_slow` is called. 0 disables slow consumer detection.
+    'slow_consumer_threshold': 0,
+    # What happens to a slow session:
+    #  - 'pause': messages are buffered until the backlog has drained.
+    #  - 'skip': messages are dropped until the backlog has drained.
+    #  - 'conflate': only the latest message is buffered until the backlog
+    #    has drained.
+    #  - 'evict': the session is closed.
+    'slow_consumer_policy': 'pause',
+    # Max number of messages buffered for a paused session. Once reached the
+    # `slow_consumer_pause_fallback` policy, 'evict' or 'skip', is applied to
+    # it. 0 is unlimited.
+    'slow_consumer_pause_limit': 1000,
+    'slow_consumer_pause_fallback': 'evict',
+    # How often in seconds slow sessions are checked. A session is resumed
+    # once its backlog is below half of `slow_consumer_threshold`.
+    'slow_consumer_check_interval': 1,
+    # Max number of bytes per second written to each session. Messages above
+    # the rate stay in the session buffer and are released as the rate
+    # allows. 0 is unlimited.
+    'outbound_byte_rate': 0,
+    # Number of bytes that may be written to a session in a burst. Defaults
+    # to `outbound_byte_rate`.
+    'outbound_byte_burst': 0,
+    # Max number of messages per second written to each session. 0 is
+    # unlimited.
+    'outbound_message_rate': 0,
+    # Number of messages that may be written to a session in a burst.
+    # Defaults to `outbound_message_rate`.
+    'outbound_message_burst': 0,
+    # How often in seconds held back messages are released.
+    'outbound_shaping_interval': 0.05,
+    # Shed load when the IOLoop falls behind. See `Endpoint.on_overload`.
+    'overload_control': False,
+    # How often in seconds the IOLoop lag is measured.
+    'overload_check_interval': 0.5,
+    # Smoothed IOLoop lag in seconds at which the endpoint becomes elevated
+    # (heartbeats are stretched, polling responses are delayed to batch more
+    # messages) and critical (new sessions are rejected).
+    'overload_lag_elevated': 0.05,
+    'overload_lag_critical': 0.2,
+    # Number of active sessions at which the endpoint becomes critical. 0 is
+    # unlimited.
+    'overload_max_sessions': 0,
+    # A level is left once its measures are below this ratio of their
+    # thresholds.
+    'overload_recovery_ratio': 0.5,
+    # Websocket sessions only get every nth heartbeat while overloaded.
+    'overload_heartbeat_stretch': 2,
+    # Seconds a poll for an existing session waits before being answered
+    # while overloaded.
+    'overload_poll_delay': 0.5,
+    # Retry hint in seconds advertised by /info while new sessions are
+    # rejected.
+    'overload_retry_after': 5,
+    # Defaults of `Endpoint.drain`. Sessions are closed in batches, one batch
+    # every `drain_interval` seconds, over `drain_duration` seconds.
+    'drain_duration': 30,
+    'drain_interval': 0.5,
+    # The close code and reason sent to drained sessions. The reason is
+    # followed by `; reconnect=<ms>`, a random delay of up to
+    # `drain_reconnect_jitter` seconds that the client should wait before
+    # reconnecting.
+    'drain_close_code': 3000,
+    'drain_close_reason': 'Server shutting down',
+    'drain_reconnect_jitter': 5,
+    # Number of recent broadcasts kept per topic, so that reconnecting clients
+    # can catch up on what they missed (see `Endpoint.replay`). Sessions that
+    # are opened with a `Last-Event-ID` header or a `last_event_id` query
+    # argument are replayed automatically. 0 disables the history.
+    'history_size': 0,
+    # Wrap recorded broadcasts as `{"id": <event id>, "data": <message>}` so
+    # that clients on every transport learn the id to resume from. The
+    # eventsource transport always sends it as the event id.
+    'history_envelope': False,
+    # Track the members of rooms (see `Connection.join`) and announce joins
+    # and leaves to each room at most every this many seconds, coalesced into
+    # one message. 0 disables presence tracking.
+    'presence_interval': 0,
+    # If set, the room every session joins when it is opened.
+    'presence_room': None,
+    # Granularity in seconds of the timers of `Connection.call_later` and
+    # `send_later`. All of them share a timer wheel, so that the IOLoop only
+    # has a single timeout however many sessions have timers.
+    'timer_resolution': 0.1,
+    # A `quota.Quota` limiting the sessions, buffered bytes and message rates
+    # of this endpoint. Set the same instance on several endpoints to limit
+    # them as a group.
+    'quota': None,
+    # Number of sessions a broadcast is delivered to per IOLoop iteration.
+    # Broadcasts to large audiences are spread over several iterations and
+    # concurrent broadcasts are merged. Even the first slice is delivered on a
+    # later iteration, so a message sent to a session right after a broadcast
+    # may reach it first. 0 delivers to everyone immediately.
+    'broadcast_slice_size': 0,
+    # Collect inbound messages from all sessions into batches that are handed
+    # to `Endpoint.on_batch` instead of `Connection.on_message(s)`.
+    'inbound_batching': False,
+    # Max number of messages in an inbound batch
+    'inbound_batch_size': 1000,
+    # Max number of seconds a message waits before its batch is handled
+    'inbound_batch_delay': 0.05,
+    # Max number of inbound messages queued or being handled before new ones
+    # are dropped
+    'inbound_batch_max_pending': 100000,
     # TODO max_sessions - the maximum number of sessions that this server can
     # support - the sockjs client should regenerate the session id and try
     # again. In a HA environment this has a high likelyhood.
@@ -86,10 +252,24 @@ class Connection(object):
         """
         Default on_message handler. Must be overridden in your application.
 
-        Called when a message has been received from the client.
+        Called when a message has been received from the client. If the
+        `raw_passthrough` setting is enabled, `message` is the JSON text of
+        the message rather than the decoded object.
         """
         raise NotImplementedError
 
+    def on_messages(self, messages):
+        """
+        Default on_messages handler.
+
+        Called with the list of all messages decoded from a single frame sent
+        by the client. Override to handle them as a batch (e.g. one bulk
+        write instead of one per message). By default, calls `on_message` for
+        each message in turn.
+        """
+        for message in messages:
+            self.on_message(message)
+
     def on_close(self):
         """
         Default on_close handler.
@@ -98,20 +278,70 @@ class Connection(object):
         any messages to the client.
         """
 
-    def send(self, message, raw=False):
+    def on_resync(self, last_event_id):
+        """
+        Called when the client reconnected asking to resume after
+        `last_event_id`, but some of the messages it missed are no longer in
+        the history (see the `history_size` setting). Override to send the
+        client a full state instead.
+        """
+
+    def send(self, message, raw=False, binary=False,
+             priority=session.base.PRIORITY_NORMAL, conflate_key=None):
         """
         Send message to the client.
 
         :param message: Message to send. If raw is False, must be JSON
-            encodable. IF raw is True, must be a json encoded byte string.
+            encodable or a :ref:`proto.PreparedMessage` (see
+            :ref:`Endpoint.prepare`). IF raw is True, must be a json encoded
+            byte string.
         :param raw: Whether the message is already JSON encoded or not.
+        :param binary: Whether the message is a bytestring that should be
+            delivered as a binary websocket frame. Transports that cannot carry
+            binary frames receive the base64 encoded bytes as a JSON string.
+        :param priority: `session.base.PRIORITY_HIGH` for control messages
+            (e.g. kicks or resyncs) that must not wait behind buffered
+            messages. They are written to the client ahead of anything of
+            lower priority that is still buffered.
+        :param conflate_key: If set, and a message sent with the same key is
+            still buffered (e.g. a polling client is between requests), that
+            message is replaced in place by this one. Use for updates where
+            only the latest value per key matters.
+        """
+        if self.is_closed:
+            return
+
+        self.session.send(
+            message,
+            raw=raw,
+            binary=binary,
+            priority=priority,
+            conflate_key=conflate_key,
+        )
+
+    def send_stream(self, chunks):
+        """
+        Send a large message to the client incrementally, so that it never has
+        to be held in memory in full. Websockets receive the message as a
+        sequence of fragmented frames, streaming transports receive the chunks
+        as they are produced. The next chunk is only pulled from `chunks` once
+        the previous one has been written to the socket, so the iterable is
+        consumed over several IOLoop iterations, and anything sent in the
+        meantime goes out after the message.
+
+        Streamed messages are never compressed, even if the websocket has
+        negotiated permessage-deflate. Use `send` for messages that should be.
+
+        :param chunks: An iterable of pieces of the JSON encoded message, e.g.
+            the output of `json.JSONEncoder.iterencode`. Chunks must not split
+            multibyte characters.
         """
         if self.is_closed:
             return
 
-        self.session.send(message, raw=raw)
+        self.session.send_stream(chunks)
 
-    def broadcast(self, message, raw=False, exclude=None):
+    def broadcast(self, message, raw=False, exclude=None, topic=None):
         """
         Broadcast message to all other sessions connected to the endpoint.
         Useful for chat style applications.
@@ -125,8 +355,73 @@ class Connection(object):
             message must be a JSON encoded bytestring.
         :param raw: Whether the message is a JSON encoded bytestring or not.
         :param exclude: A list of session_ids to NOT send the message to.
+        :param topic: The history to record the message in.
+        :returns: See :ref:`Endpoint.broadcast`.
+        """
+        return self.endpoint.broadcast(
+            message,
+            raw=raw,
+            exclude=exclude,
+            topic=topic,
+        )
+
+    def subscribe(self, name):
+        """
+        Subscribe this connection to the state channel `name`. It is sent the
+        current state and then every change. See :ref:`Endpoint.channel`.
+        """
+        self.endpoint.channel(name).subscribe(self.session)
+
+    def unsubscribe(self, name):
+        """
+        Stop receiving the changes of the state channel `name`.
+        """
+        state_channel = self.endpoint.channels.get(name)
+
+        if state_channel:
+            state_channel.unsubscribe(self.session)
+
+    def join(self, room, member=None):
+        """
+        Join this connection to `room` as `member`, by default its session
+        id. Requires the `presence_interval` setting.
+        """
+        if not self.endpoint.presence:
+            raise RuntimeError('Presence tracking is disabled, set the '
+                               'presence_interval setting to join rooms')
+
+        self.endpoint.presence.join(room, self.session, member=member)
+
+    def leave(self, room):
+        """
+        Leave `room`. Connections leave all their rooms when closed.
+        """
+        if self.endpoint.presence:
+            self.endpoint.presence.leave(room, self.session)
+
+    def call_later(self, delay, callback, *args):
+        """
+        Run `callback(*args)` after `delay` seconds, unless the connection
+        has been closed by then.
+
+        :returns: A :ref:`timer.Timer`, which can be cancelled, or `None` if
+            the connection is already closed.
+        """
+        return self.session.call_later(delay, callback, *args)
+
+    def send_later(self, delay, message, raw=False):
+        """
+        Send `message` after `delay` seconds, unless the connection has been
+        closed by then. See `send`.
         """
-        self.endpoint.broadcast(message, raw=raw, exclude=exclude)
+        return self.session.send_later(delay, message, raw=raw)
+
+    def replay(self, last_event_id, topic=None):
+        """
+        Send this connection the broadcasts of `topic` recorded after
+        `last_event_id`. See :ref:`Endpoint.replay`.
+        """
+        return self.endpoint.replay(self.session, last_event_id, topic=topic)
 
     def close(self):
         """
@@ -161,6 +456,35 @@ class Connection(object):
 
         self.on_close()
 
+    def session_slow(self):
+        """
+        Called when the underlying session is not keeping up with the messages
+        written to it.
+        """
+        self.endpoint.session_slow(self.session)
+
+    def session_overflow(self):
+        """
+        Called when the underlying session has buffered too many messages
+        while paused.
+        """
+        self.endpoint.session_overflow(self.session)
+
+    def messages_received(self, messages):
+        """
+        Called when the underlying session has received a frame of messages.
+
+        :param messages: The list of decoded messages.
+        """
+        aggregator = self.endpoint.aggregator
+
+        if aggregator:
+            aggregator.add(self.session.session_id, messages)
+
+            return
+
+        self.on_messages(messages)
+
 
 class Endpoint(object):
     """
@@ -172,6 +496,9 @@ class Endpoint(object):
         pool logic.
     :cvar connection_class: A refererence to the class that handles the
         connection logic.
+    :cvar batch_executor: If set, an executor (e.g. a
+        `concurrent.futures.ThreadPoolExecutor`) to run `on_batch` in when
+        `inbound_batching` is enabled.
     :ivar active_sessions: A dict of session_id -> Session instance of all
         active sessions currently connected to the endpoint.
     :ivar started: Whether the endpoint has started (actively
@@ -181,10 +508,24 @@ class Endpoint(object):
         ensuring that stale sessions are properly reaped.
     :ivar stats: Collects some and various interesting stats about the activity
         of the endpoint and the sessions it handles.
+    :ivar aggregator: Batches inbound messages for `on_batch` if
+        `inbound_batching` is enabled, otherwise `None`.
+    :ivar broadcaster: Delivers broadcasts incrementally if
+        `broadcast_slice_size` is set, otherwise `None`.
+    :ivar slow_sessions: The sessions that are held back because they are
+        slow, see `session_slow`.
+    :ivar drainer: Closes the sessions of the endpoint while it is being
+        drained, otherwise `None`. See `drain`.
+    :ivar overload: Tracks the overload level of the endpoint if
+        `overload_control` is enabled, otherwise `None`.
+    :ivar shaper: Limits the rate of writes to each session if
+        `outbound_byte_rate` or `outbound_message_rate` is set, otherwise
+        `None`.
     """
 
     session_class = session.Session
     session_pool_class = session.SessionPool
+    batch_executor = None
 
     @property
     def connection_class(self):
@@ -198,6 +539,36 @@ class Endpoint(object):
     def cookie_needed(self):
         return self.settings['cookie_affinity']
 
+    @property
+    def overload_level(self):
+        if not self.overload:
+            return overload.NORMAL
+
+        return self.overload.level
+
+    @property
+    def accepting_sessions(self):
+        """
+        Whether new sessions may be created.
+        """
+        if self.drainer:
+            return False
+
+        if self.quota and not self.quota.sessions_available:
+            return False
+
+        return self.overload_level < overload.CRITICAL
+
+    @property
+    def poll_delay(self):
+        """
+        Seconds a poll for an existing session waits before it is answered.
+        """
+        if self.overload_level < overload.ELEVATED:
+            return 0
+
+        return self.settings['overload_poll_delay']
+
     def __init__(self, settings=None):
         """
         Initialise the SockJS Endpoint.
@@ -213,11 +584,114 @@ class Endpoint(object):
         if settings:
             self.settings.update(settings)
 
+        strategy = self.settings['heartbeat_strategy']
+
+        if strategy not in session.base.HEARTBEAT_STRATEGIES:
+            raise ValueError('Unknown heartbeat_strategy %r' % (strategy,))
+
+        policy = self.settings['slow_consumer_policy']
+
+        if policy not in session.base.BACKPRESSURE_POLICIES:
+            raise ValueError('Unknown slow_consumer_policy %r' % (policy,))
+
+        fallback = self.settings['slow_consumer_pause_fallback']
+
+        if fallback not in ('evict', 'skip'):
+            raise ValueError(
+                'Unknown slow_consumer_pause_fallback %r' % (fallback,)
+            )
+
+        self.stats = stats.StatsCollector()
+
+        self.quota = self.settings['quota']
+        self.stats.quota = self.quota
         self.session_pool = self.session_pool_class(
             self.settings['session_check_interval'],
             self.settings['heartbeat_delay'],
+            heartbeat_timeout=self.settings['heartbeat_timeout'],
+            stats=self.stats,
         )
-        self.stats = stats.StatsCollector()
+        self.aggregator = None
+
+        if self.settings['inbound_batching']:
+            self.aggregator = batch.InboundAggregator(
+                self.on_batch,
+                self.settings['inbound_batch_size'],
+                self.settings['inbound_batch_delay'],
+                self.settings['inbound_batch_max_pending'],
+                executor=self.batch_executor,
+                stats=self.stats,
+            )
+
+        self.broadcaster = None
+
+        if self.settings['broadcast_slice_size']:
+            self.broadcaster = broadcast.Broadcaster(
+                self,
+                self.settings['broadcast_slice_size'],
+            )
+
+        self.shaper = None
+
+        if (self.settings['outbound_byte_rate'] or
+                self.settings['outbound_message_rate']):
+            self.shaper = shaper.Shaper(
+                self.settings['outbound_byte_rate'],
+                self.settings['outbound_byte_burst'],
+                self.settings['outbound_message_rate'],
+                self.settings['outbound_message_burst'],
+                self.settings['outbound_shaping_interval'],
+                stats=self.stats,
+            )
+
+        self.overload = None
+
+        if self.settings['overload_control']:
+            self.overload = overload.OverloadController(
+                self,
+                self.settings['overload_check_interval'],
+                (
+                    self.settings['overload_lag_elevated'],
+                    self.settings['overload_lag_critical'],
+                ),
+                max_sessions=self.settings['overload_max_sessions'],
+                recovery_ratio=self.settings['overload_recovery_ratio'],
+                stats=self.stats,
+            )
+
+        self.drainer = None
+
+        # the second in which a dropped broadcast was last logged
+        self.broadcast_drop_logged = 0
+
+        # topic -> History
+        self.histories = {}
+        # ids start at the current time in microseconds, so that the ids of
+        # a restarted process are above those of the one before it and the
+        # stale ids of its clients are told apart (see `replay`)
+        self.first_event_id = int(time.time() * 1000000)
+        self.last_event_id = self.first_event_id
+
+        # name -> StateChannel
+        self.channels = {}
+
+        self.timer_wheel = timer.TimerWheel(self.settings['timer_resolution'])
+
+        self.presence = None
+
+        if self.settings['presence_interval']:
+            self.presence = presence.Presence(
+                self.settings['presence_interval'],
+            )
+
+        self.slow_sessions = set()
+        self.slow_periodic_callback = None
+
+        if self.settings['slow_consumer_threshold']:
+            self.slow_periodic_callback = ioloop.PeriodicCallback(
+                self.check_slow_sessions,
+                self.settings['slow_consumer_check_interval'] * 1000,
+            )
 
         self.start()
 
@@ -233,6 +707,12 @@ class Endpoint(object):
         self.session_pool.start()
         self.stats.start()
 
+        if self.slow_periodic_callback:
+            self.slow_periodic_callback.start()
+
+        if self.overload:
+            self.overload.start()
+
         self.on_started()
 
     def stop(self):
@@ -246,9 +726,37 @@ class Endpoint(object):
 
         self.on_stopping()
 
+        if self.aggregator:
+            self.aggregator.flush()
+
+        if self.broadcaster:
+            self.broadcaster.stop()
+
+        if self.slow_periodic_callback:
+            self.slow_periodic_callback.stop()
+
+        if self.shaper:
+            self.shaper.stop()
+
+        if self.overload:
+            self.overload.stop()
+
+        if self.drainer:
+            self.drainer.stop()
+            self.drainer = None
+
+        self.timer_wheel.stop()
+
+        self.slow_sessions = set()
+
         self.session_pool.stop()
         self.stats.stop()
 
+        # after the sessions have been closed, their leaves would schedule
+        # an announcement otherwise
+        if self.presence:
+            self.presence.stop()
+
         if self.session_pool:
             self.session_pool = None
 
@@ -277,6 +785,65 @@ class Endpoint(object):
         has been torn down.
         """
 
+    def drain(self, duration=None, code=None, reason=None):
+        """
+        Stop accepting new sessions and close the existing ones gradually, so
+        that their clients do not all reconnect to the other nodes at once.
+        Call `stop` once the returned future has resolved.
+
+        Sessions are closed in batches every `drain_interval` seconds. Each
+        close reason carries a jittered reconnect delay, see
+        `drain_reconnect_jitter`.
+
+        :param duration: Seconds over which to close the sessions. Defaults to
+            the `drain_duration` setting.
+        :param code: The close code. Defaults to `drain_close_code`.
+        :param reason: The close reason. Defaults to `drain_close_reason`.
+        :returns: A future that resolves once no sessions are left.
+        """
+        if self.drainer:
+            return self.drainer.future
+
+        settings = self.settings
+
+        self.drainer = drain.Drainer(
+            self,
+            settings['drain_duration'] if duration is None else duration,
+            settings['drain_interval'],
+            settings['drain_close_code'] if code is None else code,
+            settings['drain_close_reason'] if reason is None else reason,
+            settings['drain_reconnect_jitter'],
+        )
+
+        return self.drainer.start()
+
+    def on_overload(self, level):
+        """
+        Called when the overload level of the endpoint changes. Stretches the
+        websocket heartbeats while overloaded, see `poll_delay` and
+        `accepting_sessions` for the other measures.
+
+        :param level: The new level, one of `overload.NORMAL`,
+            `overload.ELEVATED` or `overload.CRITICAL`.
+        """
+        stretch = 1
+
+        if level >= overload.ELEVATED:
+            stretch = self.settings['overload_heartbeat_stretch']
+
+        self.session_pool.set_heartbeat_stretch(stretch)
+
+    def on_batch(self, batch):
+        """
+        Called with a batch of inbound messages when `inbound_batching` is
+        enabled. Runs in `batch_executor` if one is set, so must not touch
+        sessions directly in that case.
+
+        :param batch: A list of `(session_id, message)` tuples, in the order
+            they were received.
+        """
+        raise NotImplementedError
+
     def get_urls(self, prefix):
         """List of the URLs to be added to the Tornado application"""
         return urls.get_urls(
@@ -296,15 +863,16 @@ class Endpoint(object):
         """
         return self.connection_class(self, session)
 
-    def create_session(self, session_id, register=True):
+    def create_session(self, session_id, register=True, managed=True):
         """
         Create new session instance and return it.
 
         :param session_id: The unique id of the session.
         :param register: Whether the session should be registered with the
-            :ref:`session_pool`. Websocket connections do not get registered
-            because the TCP close event is enough to immediately close the
-            session.
+            :ref:`session_pool`.
+        :param managed: Whether the :ref:`session_pool` should garbage collect
+            the session. Websocket sessions are not managed because ping/pong
+            and the TCP close event are enough to close the session.
         """
         session_ttl = (
             self.settings['heartbeat_delay'] +
@@ -316,15 +884,55 @@ class Endpoint(object):
             session_ttl,
         )
 
+        self.configure_session(sess)
+
         conn = self.create_connection(sess)
 
         sess.bind(conn)
 
         if register:
-            self.session_pool.add(sess)
+            self.session_pool.add(sess, managed=managed)
 
         return sess
 
+    def configure_session(self, sess):
+        """
+        Apply the settings of this endpoint to a newly created session.
+        Session defaults are class attributes, so they are only set on the
+        instance when they differ.
+
+        :param sess: The session instance.
+        """
+        settings = self.settings
+
+        sess.timer_wheel = self.timer_wheel
+
+        if self.quota:
+            sess.quota = self.quota
+            self.quota.add_session()
+
+        if settings['dispatch_budget']:
+            sess.dispatch_budget = settings['dispatch_budget']
+
+        if settings['dispatch_time_budget']:
+            sess.dispatch_time_budget = settings['dispatch_time_budget']
+
+        if settings['heartbeat_strategy'] != sess.heartbeat_strategy:
+            sess.heartbeat_strategy = settings['heartbeat_strategy']
+
+        if settings['slow_consumer_threshold']:
+            sess.slow_threshold = settings['slow_consumer_threshold']
+            sess.pause_limit = settings['slow_consumer_pause_limit']
+
+        if settings['send_buffer_limit']:
+            sess.send_buffer_limit = settings['send_buffer_limit']
+
+        if settings['priority_buffer_limit']:
+            sess.priority_buffer_limit = settings['priority_buffer_limit']
+
+        if self.shaper:
+            self.shaper.attach(sess)
+
     def get_session(self, session_id):
         """
         Get session by session id.
@@ -342,6 +950,32 @@ class Endpoint(object):
         """
         self.active_sessions[session.session_id] = session
 
+        if self.presence and self.settings['presence_room'] is not None:
+            self.presence.join(self.settings['presence_room'], session)
+
+        if self.settings['history_size']:
+            last_event_id = self.get_last_event_id(session.conn_info)
+
+            if last_event_id is not None:
+                if not self.replay(session, last_event_id):
+                    session.conn.on_resync(last_event_id)
+
+    def get_last_event_id(self, conn_info):
+        """
+        Return the event id a reconnecting client has asked to resume from,
+        or `None`.
+        """
+        if conn_info is None:
+            return None
+
+        value = (conn_info.get_header('Last-Event-ID') or
+                 conn_info.get_argument('last_event_id'))
+
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
     def session_closed(self, session):
         """
         Called by the underlying session transports signalling that the session
@@ -351,22 +985,241 @@ class Endpoint(object):
         """
         self.active_sessions.pop(session.session_id, None)
 
-    def broadcast(self, message, raw=False, exclude=None):
+        if self.session_pool:
+            self.session_pool.discard(session)
+
+        for state_channel in self.channels.values():
+            state_channel.unsubscribe(session)
+
+        if self.presence:
+            self.presence.leave_all(session)
+
+        quota = session.quota
+
+        if quota:
+            session.quota = None
+
+            quota.remove_session()
+            quota.release_buffer(session.buffered_bytes)
+
+        if session in self.slow_sessions:
+            self.slow_sessions.discard(session)
+
+            if self.stats:
+                self.stats.on_sess_resumed()
+
+    def session_slow(self, session):
+        """
+        Called when a session is not keeping up with the messages written to
+        it. Applies the `slow_consumer_policy`.
+
+        :param session: The slow session.
+        """
+        policy = self.settings['slow_consumer_policy']
+
+        if policy == 'evict':
+            self.evict_session(session)
+
+            return
+
+        session.backpressure = policy
+
+        self.slow_sessions.add(session)
+        self.stats.on_sess_slow()
+
+    def session_overflow(self, session):
+        """
+        Called when a paused session has buffered `slow_consumer_pause_limit`
+        messages. Applies the `slow_consumer_pause_fallback` policy.
+
+        :param session: The paused session.
+        """
+        if self.settings['slow_consumer_pause_fallback'] == 'evict':
+            self.evict_session(session)
+        else:
+            session.backpressure = 'skip'
+
+    def evict_session(self, session):
+        self.stats.on_sess_evicted()
+
+        session.close(3000, 'Slow consumer')
+
+    def check_slow_sessions(self):
+        """
+        Resume the slow sessions whose backlog has drained below half of the
+        threshold.
+        """
+        for sess in list(self.slow_sessions):
+            transport = sess.send_transport
+
+            if transport:
+                if transport.write_backlog() > sess.slow_threshold // 2:
+                    continue
+
+            self.slow_sessions.discard(sess)
+            self.stats.on_sess_resumed()
+
+            sess.resume()
+
+    def broadcast(self, message, raw=False, exclude=None, topic=None):
         """
         Send a message to every active session.
 
-        :param message: If raw is False, can be any JSON encodable object. If
-            raw is True, must be a bytestring.
+        :param message: If raw is False, can be any JSON encodable object or a
+            :ref:`proto.PreparedMessage`. If raw is True, must be a
+            bytestring.
         :param raw: Whether the message has already been encoded.
         :param exclude: A list of session_ids to exclude from receiving the
             broadcast.
+        :param topic: The history the message is recorded in, if
+            `history_size` is set.
+        :returns: `None` if the message was handed to every session
+            immediately. If `broadcast_slice_size` is set, a future that
+            resolves once the message has been handed to every session, or
+            at once if the quota has dropped the broadcast.
+
+        With `broadcast_slice_size` set, delivery only starts on the next
+        IOLoop iteration. Messages sent with `Connection.send` after calling
+        this may reach their session before the broadcast does, wait on the
+        returned future where the order matters.
         """
+        if self.quota:
+            recipients = len(self.active_sessions)
+
+            if not self.quota.allow_broadcast(recipients):
+                self.broadcast_dropped(recipients)
+
+                if self.broadcaster:
+                    # callers of a sliced broadcast wait on the future
+                    future = concurrent.Future()
+                    future.set_result(None)
+
+                    return future
+
+                return None
+
+        if self.settings['history_size']:
+            message = self.record(message, raw, topic)
+        elif not isinstance(message, proto.PreparedMessage):
+            # encode once for all recipients, frames are shared per transport
+            message = proto.PreparedMessage(message, raw=raw)
+
+        if self.broadcaster:
+            return self.broadcaster.broadcast(message, exclude=exclude)
+
         for sess in self.active_sessions.values():
             if exclude and sess.session_id in exclude:
                 continue
 
             sess.send(message)
 
+    def broadcast_dropped(self, recipients):
+        """
+        Called when the quota has dropped a broadcast to `recipients`
+        sessions. Drops are counted in the stats and logged at most once a
+        second.
+        """
+        self.stats.on_broadcast_dropped()
+
+        now = int(time.time())
+
+        if now == self.broadcast_drop_logged:
+            return
+
+        self.broadcast_drop_logged = now
+
+        LOG.warning(
+            'Broadcast to %d sessions dropped by %r (%d dropped so far)',
+            recipients,
+            self.quota,
+            self.stats.broadcasts_dropped,
+        )
+
+    def record(self, message, raw=False, topic=None):
+        """
+        Record a message in the history of `topic` under the next event id.
+
+        :returns: The :ref:`proto.PreparedMessage` to send, carrying the id.
+        """
+        if not isinstance(message, proto.PreparedMessage):
+            message = proto.PreparedMessage(message, raw=raw)
+
+        data = message.data
+
+        self.last_event_id += 1
+
+        event_id = self.last_event_id
+
+        if self.settings['history_envelope']:
+            data = '{"id":%d,"data":%s}' % (event_id, data)
+
+        message = proto.PreparedMessage(data, raw=True, event_id=event_id)
+
+        topic_history = self.histories.get(topic)
+
+        if topic_history is None:
+            topic_history = self.histories[topic] = history.History(
+                self.settings['history_size'],
+            )
+
+        topic_history.append(message)
+
+        return message
+
+    def replay(self, session, last_event_id, topic=None):
+        """
+        Send `session` the messages of `topic` recorded after
+        `last_event_id`.
+
+        :returns: `False` if some of those messages are no longer in the
+            history or `last_event_id` was not issued by this endpoint (e.g.
+            before a restart), in which case nothing is sent and the client
+            has to resynchronize by other means.
+        """
+        if not self.first_event_id <= last_event_id <= self.last_event_id:
+            return False
+
+        topic_history = self.histories.get(topic)
+
+        if topic_history is None:
+            # nothing has been recorded, so nothing was missed
+            return True
+
+        missed = topic_history.since(last_event_id)
+
+        if missed is None:
+            return False
+
+        for message in missed:
+            session.send(message)
+
+        return True
+
+    def channel(self, name):
+        """
+        Return the :ref:`channel.StateChannel` called `name`, creating it on
+        first use.
+        """
+        state_channel = self.channels.get(name)
+
+        if state_channel is None:
+            state_channel = self.channels[name] = channel.StateChannel(name)
+
+        return state_channel
+
+    def prepare(self, message, raw=False):
+        """
+        Encode a message once so that it can be sent to many sessions, e.g.
+        when sending to a filtered set of sessions one by one. The result can
+        be passed to `Connection.send` and `broadcast`.
+
+        :param message: If raw is False, can be any JSON encodable object. If
+            raw is True, must be a bytestring.
+        :param raw: Whether the message has already been encoded.
+        :returns: An immutable :ref:`proto.PreparedMessage`.
+        """
+        return proto.PreparedMessage(message, raw=raw)
+
 
 class Server(object):
     """
@@ -447,6 +1300,17 @@ class Server(object):
         for endpoint in self.endpoints.values():
             endpoint.start()
 
+    def drain(self, duration=None):
+        """
+        Drain all the endpoints of this server, see :ref:`Endpoint.drain`.
+
+        :returns: A future that resolves once all the endpoints are empty.
+        """
+        return gen.multi([
+            endpoint.drain(duration)
+            for endpoint in self.endpoints.values()
+        ])
+
     def stop(self):
         """
         Stop this server.
@@ -8,6 +8,7 @@
 
 from sockjs.tornado.session import base
 from sockjs.tornado.session.pool import SessionPool
+from sockjs.tornado.util import str_to_bytes
 
 
 __all__ = [
@@ -16,21 +17,201 @@ __all__ = [
 ]
 
 
+def buffer_size(data):
+    # raw websocket sessions buffer `(data, binary)` tuples
+    if isinstance(data, tuple):
+        data = data[0]
+
+    return len(str_to_bytes(data))
+
+
 class Session(base.BaseSession):
     """
     This is the standard session that holds all buffered messages in memory.
+
+    Messages are buffered in one lane per priority. The high priority lane is
+    only allocated once it is used.
+
+    While the backpressure of the session is 'conflate', every normal
+    priority message replaces all the others in the buffer.
+
+    A buffered message sent with a conflate key is replaced in place by the
+    next message sent with the same key (and priority), so only the latest
+    value per key is delivered.
+
+    :cvar send_buffer_limit: The max number of entries in the normal priority
+        lane. The oldest entries are dropped to make room. 0 is unlimited.
+    :cvar priority_buffer_limit: Same as `send_buffer_limit`, for the high
+        priority lane.
+    :ivar send_buffer: The normal priority lane.
+    :ivar priority_buffer: The high priority lane.
+    :ivar conflate_index: A dict of conflate key -> `(high, position)` of the
+        buffered messages sent with a conflate key. Positions count every
+        message ever appended to the lane, so dropping the oldest entries does
+        not invalidate them.
+
+    With a quota, messages that do not fit in its `max_buffered_bytes` are
+    dropped.
     """
 
+    send_buffer_limit = 0
+    priority_buffer_limit = 0
+    priority_buffer = ()
+    conflate_index = None
+
+    # number of entries dropped or taken from the front of each lane
+    send_buffer_dropped = 0
+    priority_buffer_dropped = 0
+
     def __init__(self, *args, **kwargs):
         super(Session, self).__init__(*args, **kwargs)
 
         self.send_buffer = []
 
-    def append_to_buffer(self, data):
-        self.send_buffer.append(data)
+    def append_to_buffer(self, data, priority=base.PRIORITY_NORMAL,
+                         conflate_key=None):
+        high = priority > base.PRIORITY_NORMAL
+
+        if high:
+            if not self.priority_buffer:
+                self.priority_buffer = []
+
+            lane = self.priority_buffer
+            limit = self.priority_buffer_limit
+            dropped = self.priority_buffer_dropped
+        else:
+            lane = self.send_buffer
+            limit = self.send_buffer_limit
+
+            if lane and self.backpressure == 'conflate':
+                if self.quota:
+                    self.account(-sum(buffer_size(d) for d in lane))
+
+                # positions of the conflate index fall behind
+                self.send_buffer_dropped += len(lane)
+                lane = self.send_buffer = []
+
+            dropped = self.send_buffer_dropped
+
+        if conflate_key is not None:
+            index = self.conflate_index
+
+            if index is None:
+                index = self.conflate_index = {}
+
+            slot = index.get(conflate_key)
+
+            if slot is not None and slot[0] == high and slot[1] >= dropped:
+                position = slot[1] - dropped
+
+                if self.quota:
+                    size = buffer_size(data) - buffer_size(lane[position])
+
+                    if not self.quota.reserve_buffer(size):
+                        return
+
+                    self.buffered_bytes += size
+
+                lane[position] = data
+
+                return
+
+        if self.quota:
+            size = buffer_size(data)
+
+            if not self.quota.reserve_buffer(size):
+                return
+
+            self.buffered_bytes += size
+
+        if conflate_key is not None:
+            index[conflate_key] = (high, dropped + len(lane))
+
+        lane.append(data)
+
+        if limit and len(lane) > limit:
+            if self.quota:
+                self.account(-buffer_size(lane[0]))
+
+            del lane[0]
+
+            if high:
+                self.priority_buffer_dropped += 1
+            else:
+                self.send_buffer_dropped += 1
 
     def get_buffer(self):
+        if self.priority_buffer:
+            return self.priority_buffer + self.send_buffer
+
         return self.send_buffer
 
+    def account(self, size):
+        # the size of a message replaced or dropped, reserved already
+        self.buffered_bytes += size
+        self.quota.release_buffer(-size)
+
+    def buffered_count(self):
+        return len(self.priority_buffer) + len(self.send_buffer)
+
+    def take_buffer(self, count=None):
+        high = self.priority_buffer
+        normal = self.send_buffer
+
+        if count is not None:
+            high = high[:count]
+            normal = normal[:max(count - len(high), 0)]
+
+        # positions in the conflate index stay valid, those of the taken
+        # entries fall behind the dropped counts until they are restored
+        if high:
+            if len(high) == len(self.priority_buffer):
+                self.priority_buffer = ()
+            else:
+                del self.priority_buffer[:len(high)]
+
+            self.priority_buffer_dropped += len(high)
+
+        if normal:
+            if len(normal) == len(self.send_buffer):
+                self.send_buffer = []
+            else:
+                del self.send_buffer[:len(normal)]
+
+            self.send_buffer_dropped += len(normal)
+
+        if self.quota:
+            self.account(-sum(buffer_size(d) for d in high) -
+                         sum(buffer_size(d) for d in normal))
+
+        return list(high), normal
+
+    def restore_buffer(self, taken):
+        high, normal = taken
+
+        if high:
+            self.priority_buffer = high + list(self.priority_buffer)
+            self.priority_buffer_dropped -= len(high)
+
+        if normal:
+            self.send_buffer = normal + self.send_buffer
+            self.send_buffer_dropped -= len(normal)
+
+        if self.quota:
+            self.account(sum(buffer_size(d) for d in high) +
+                         sum(buffer_size(d) for d in normal))
+
     def clear_buffer(self):
+        if self.buffered_bytes:
+            if self.quota:
+                self.quota.release_buffer(self.buffered_bytes)
+
+            self.buffered_bytes = 0
+
         self.send_buffer = []
+
+        if self.priority_buffer:
+            self.priority_buffer = ()
+
+        if self.conflate_index:
+            self.conflate_index = None
@@ -1,11 +1,17 @@
+from collections import deque
 from datetime import datetime
-
+import functools
+import itertools
 import time
 
+from tornado import concurrent
+from tornado import ioloop
+from tornado.websocket import WebSocketClosedError
+
 from sockjs.tornado import proto
 from sockjs.tornado.log import session as LOG
 from sockjs.tornado.session import exc
-from sockjs.tornado.util import str_to_bytes
+from sockjs.tornado.util import bytes_to_str
 
 
 __all__ = [
@@ -22,6 +28,24 @@ CLOSING = 2
 # session was closed cleanly
 CLOSED = 3
 
+# Heartbeat strategies, see `BaseSession.send_heartbeat`
+HEARTBEAT_STRATEGIES = ('auto', 'ping', 'frame')
+
+# What `BaseSession.send_heartbeat` sent, a bitmask
+# a SockJS `h` frame
+HEARTBEAT_FRAME = 1
+# a transport level ping
+HEARTBEAT_PING = 2
+
+# Outbound message priorities, higher priority messages are written to the
+# client ahead of any buffered lower priority ones
+PRIORITY_NORMAL = 0
+PRIORITY_HIGH = 1
+
+# What happens to the messages sent to a slow session, see
+# `BaseSession.backpressure`
+BACKPRESSURE_POLICIES = ('pause', 'skip', 'conflate', 'evict')
+
 
 class ITransport(object):
     """
@@ -47,6 +71,28 @@ class ITransport(object):
         sending SockJS frames to the client.
         """
 
+    @property
+    def binary(self):
+        """
+        This property must be set to `True` if the transport is capable of
+        sending binary frames to the client via `send_binary`.
+        """
+
+    def write_backlog(self):
+        """
+        Return the number of bytes written by the transport that the socket
+        has not accepted yet.
+        """
+
+    def send_ping(self):
+        """
+        Send a transport level ping to the client. The session must be told
+        about the pong via `LivenessMixin.pong_received`.
+
+        :returns: `True` if a ping was sent, `False` if the transport does
+            not support pings.
+        """
+
 
 class StateMixin(object):
     """
@@ -256,39 +302,44 @@ class ExpiryMixin(object):
     :ivar expires_at: The absolute timestamp at which this session will expire.
     :ivar ttl: The number of seconds from the current time value that the
         session will expire.
+    :ivar time_func: When called, returns the number of seconds since the
+        epoch. Defaults to `time.time`, only replaced by simulations and tests.
     """
 
-    def __init__(self, ttl, time_func=time.time):
+    time_func = staticmethod(time.time)
+
+    def __init__(self, ttl, time_func=None):
         """
         :param ttl: This one should be obvious :)
         :param time_func: When called, returns the number of seconds since the
-            epoch. Used for testing. Should not be supplied in all other
-            scenarios.
+            epoch. Used for testing and simulation. Should not be supplied in
+            all other scenarios.
         """
         self.ttl = ttl
 
-        self.set_expiry(ttl, time_func=time_func)
+        if time_func is not None:
+            self.time_func = time_func
 
-    def touch(self, time_func=time.time):
+        self.set_expiry(ttl)
+
+    def touch(self, time_func=None):
         """
         Mark this session as alive - Do this by updating the `expires_at` to
         it's maximum value.
 
         :param time_func: When called, returns the number of seconds since the
-            epoch. Used for testing. Should not be supplied in all other
-            scenarios.
+            epoch. If not supplied, `self.time_func` is used.
         """
-        self.expires_at = time_func() + self.ttl
+        self.expires_at = (time_func or self.time_func)() + self.ttl
 
-    def set_expiry(self, expires, time_func=time.time):
+    def set_expiry(self, expires, time_func=None):
         """
         :param expires:
             - None/0: session will never expire.
             - int/long: seconds until the session expires.
             - datetime: absolute date/time that the session will expire.
         :param time_func: When called, returns the number of seconds since the
-            epoch. Used for testing. Should not be supplied in all other
-            scenarios.
+            epoch. If not supplied, `self.time_func` is used.
         """
         if not expires:
             self.expires_at = 0
@@ -300,11 +351,11 @@ class ExpiryMixin(object):
 
         if expires < 1e9:
             # delta
-            expires += time_func()
+            expires += (time_func or self.time_func)()
 
         self.expires_at = expires
 
-    def has_expired(self, now=None, time_func=time.time):
+    def has_expired(self, now=None, time_func=None):
         """
         Whether this session has expired.
 
@@ -312,16 +363,79 @@ class ExpiryMixin(object):
             expiry of this session will be evaluated. If not supplied, the
             sytem time will be used.
         :param time_func: When called, returns the number of seconds since the
-            epoch. Used for testing. Should not be supplied in all other
-            scenarios.
+            epoch. If not supplied, `self.time_func` is used.
         """
         if not self.expires_at:
             return False
 
-        return self.expires_at <= (now or time_func())
+        return self.expires_at <= (now or (time_func or self.time_func)())
+
+
+class LivenessMixin(object):
+    """
+    Measures the round trip time to the client using transport level pings and
+    detects peers that have stopped responding to them.
+
+    Relies on `ExpiryMixin.time_func`.
+
+    :ivar ping_sent_at: When the outstanding ping was sent, `None` if no ping
+        is waiting for its pong.
+    :ivar rtt: The smoothed round trip time in seconds, `None` until the first
+        pong has been received.
+    :cvar rtt_alpha: The weight of each new sample in the smoothed rtt.
+    """
+
+    rtt_alpha = 0.125
+
+    def __init__(self):
+        self.ping_sent_at = None
+        self.rtt = None
+
+    def ping_sent(self):
+        """
+        Record that a ping has been sent. If an earlier ping is still waiting
+        for its pong, the earlier send time is kept.
+        """
+        if self.ping_sent_at is None:
+            self.ping_sent_at = self.time_func()
+
+    def pong_received(self):
+        """
+        Record that a pong has been received.
+
+        :returns: The round trip time of the ping in seconds, or `None` for an
+            unsolicited pong.
+        """
+        sent_at = self.ping_sent_at
+
+        if sent_at is None:
+            return None
+
+        self.ping_sent_at = None
+
+        sample = max(self.time_func() - sent_at, 0)
+
+        if self.rtt is None:
+            self.rtt = sample
+        else:
+            self.rtt += self.rtt_alpha * (sample - self.rtt)
+
+        return sample
+
+    def pong_overdue(self, timeout, now=None):
+        """
+        Whether the pong for the outstanding ping is more than `timeout`
+        seconds late.
+        """
+        sent_at = self.ping_sent_at
+
+        if sent_at is None:
+            return False
+
+        return (now or self.time_func()) - sent_at >= timeout
 
 
-class BaseSession(StateMixin, TransportMixin, ExpiryMixin):
+class BaseSession(StateMixin, TransportMixin, ExpiryMixin, LivenessMixin):
     """
     Base class for SockJS sessions. Provides a transport independent way to
     queue data frames from/to the client.
@@ -331,25 +445,90 @@ class BaseSession(StateMixin, TransportMixin, ExpiryMixin):
         All session events will be dispatched to this object.
     :ivar conn_info: Pertinent information about the connection (ip addr etc.)
         :see:`sockjs.transport.ConnectionInfo`.
+    :cvar dispatch_budget: The max number of messages dispatched to the conn
+        per IOLoop iteration before yielding to other sessions. 0 is
+        unlimited.
+    :cvar dispatch_time_budget: The max number of seconds spent dispatching
+        messages to the conn per IOLoop iteration before yielding to other
+        sessions. 0 is unlimited.
+    :cvar dispatch_chunk_size: With a `dispatch_time_budget`, the max number
+        of messages dispatched at once between checks of the clock.
+    :cvar heartbeat_strategy: How the session is kept alive by
+        `send_heartbeat`, one of `HEARTBEAT_STRATEGIES`.
+    :cvar slow_threshold: If the transport has more than this many bytes
+        waiting to be sent after a write, the session is slow and the conn is
+        told via `session_slow`. 0 disables the check.
+    :ivar slow: Whether the session has been found to be slow.
+    :ivar backpressure: What happens to messages sent while the session is
+        slow, set by whoever handles `session_slow`:
+        - None: messages are written to the transport as usual.
+        - 'pause': messages are buffered until `resume` is called. Once
+          `pause_limit` messages are buffered the conn is told via
+          `session_overflow`.
+        - 'skip': messages are dropped.
+        - 'conflate': only the latest normal priority message is kept in
+          the buffer, high priority messages are buffered.
+    :cvar pause_limit: The max number of messages buffered while paused, 0
+        is unlimited.
+    :cvar shaper: The :ref:`shaper.Shaper` that limits the rate of writes to
+        the session, if any.
+    :ivar last_event_id: The history id of the newest recorded broadcast
+        written to the transport.
+    :ivar buffered_event_id: The history id of the newest recorded broadcast
+        waiting in the buffer.
+    :cvar timer_wheel: The :ref:`timer.TimerWheel` that runs the timers of
+        `call_later` and `send_later`.
+    :ivar timers: The pending timers of the session, cancelled when it is
+        closed.
+    :cvar quota: The :ref:`quota.Quota` of the endpoint, if any.
+    :ivar buffered_bytes: The number of bytes in the buffer, counted against
+        the quota.
+    :ivar stream_future: The future of the message being written by
+        `send_stream`, if any. Everything else is buffered until it is done.
     """
 
     # helpful way of getting to the session exceptions.
     exc = exc
 
-    def __init__(self, session_id, ttl):
+    dispatch_budget = 0
+    dispatch_time_budget = 0
+    dispatch_chunk_size = 64
+    heartbeat_strategy = 'auto'
+    slow_threshold = 0
+    slow = False
+    backpressure = None
+    pause_limit = 0
+    shaper = None
+    byte_bucket = None
+    message_bucket = None
+    last_event_id = 0
+    buffered_event_id = 0
+    timer_wheel = None
+    timers = None
+    quota = None
+    buffered_bytes = 0
+    stream_future = None
+
+    def __init__(self, session_id, ttl, time_func=None):
         """
         :param session_id: A unique, random ascii bytestring that represents
             the id of the session. This must be unique per server.
         :param ttl: The ttl (:see:`ExpiryMixin.ttl`).
+        :param time_func: See :ref:`ExpiryMixin.time_func`.
         """
         StateMixin.__init__(self)
         TransportMixin.__init__(self)
-        ExpiryMixin.__init__(self, ttl)
+        ExpiryMixin.__init__(self, ttl, time_func=time_func)
+        LivenessMixin.__init__(self)
 
         self.session_id = session_id
         self.conn = None
         self.conn_info = None
 
+        # only used when a dispatch budget is set
+        self.dispatch_queue = None
+        self.dispatch_scheduled = False
+
     def __repr__(self):
         handlers = ''
 
@@ -399,6 +578,12 @@ class BaseSession(StateMixin, TransportMixin, ExpiryMixin):
         """
         Called when the session has been closed.
         """
+        if self.timers:
+            self.cancel_timers()
+
+        if self.shaper:
+            self.shaper.detach(self)
+
         if self.conn:
             # only dispatch the close event if we were previously opened
             try:
@@ -408,14 +593,61 @@ class BaseSession(StateMixin, TransportMixin, ExpiryMixin):
             finally:
                 self.conn = None
 
-        if self.send_transport:
-            self.send_transport.session_closed(self)
+        transport = self.send_transport
+
+        if transport and self.stream_future is not None:
+            # a close frame cannot follow a message that is half written
+            self.send_transport = None
+            self.did_close()
+
+            transport.abort_connection()
+        elif transport:
+            transport.session_closed(self)
             self.send_transport = None
 
         if self.recv_transport:
             self.recv_transport.session_closed(self)
             self.recv_transport = None
 
+    def call_later(self, delay, callback, *args):
+        """
+        Run `callback(*args)` after `delay` seconds, unless the session has
+        been closed by then.
+
+        :returns: The :ref:`timer.Timer`, which can be cancelled, or `None` if
+            the session is already closed.
+        """
+        if self.closed:
+            return None
+
+        if self.timers is None:
+            self.timers = set()
+
+        timer = self.timer_wheel.call_later(
+            delay,
+            callback,
+            *args,
+            owner=self
+        )
+
+        self.timers.add(timer)
+
+        return timer
+
+    def send_later(self, delay, message, raw=False):
+        """
+        Send `message` after `delay` seconds, unless the session has been
+        closed by then. See `send`.
+        """
+        return self.call_later(delay, self.send, message, raw)
+
+    def timer_done(self, timer):
+        self.timers.discard(timer)
+
+    def cancel_timers(self):
+        for timer in list(self.timers):
+            timer.cancel()
+
     def has_expired(self, *args, **kwargs):
         if self.closed:
             return True
@@ -438,73 +670,431 @@ class BaseSession(StateMixin, TransportMixin, ExpiryMixin):
 
         :param messages: One or more messages. This can be of any type/value.
             It is up to the conn object to validate its content.
+        :returns: `None` if the messages were dispatched immediately. If a
+            dispatch budget is set, a future that resolves once all the
+            messages have been dispatched (or the session has closed).
         """
         self.touch()
 
-        for msg in messages:
-            try:
-                self.conn.on_message(msg)
-            except:
-                LOG.exception(self.session_id)
+        if self.quota and not self.quota.allow_inbound(len(messages)):
+            return None
+
+        if not (self.dispatch_budget or self.dispatch_time_budget):
+            self.deliver(messages)
+
+            return None
+
+        future = concurrent.Future()
+
+        queue = self.dispatch_queue
+
+        if queue is None:
+            queue = self.dispatch_queue = deque()
+
+        queue.append([messages, 0, future])
+
+        if len(queue) == 1 and not self.dispatch_scheduled:
+            self.run_dispatch()
+
+        return future
+
+    def run_dispatch(self):
+        """
+        Dispatch queued messages until the budget for this IOLoop iteration
+        has been used up, then resume on the next iteration. Messages are
+        always dispatched in the order they were received.
+        """
+        self.dispatch_scheduled = False
+
+        queue = self.dispatch_queue
+        budget = self.dispatch_budget
+        deadline = 0
+        dispatched = 0
+
+        if self.dispatch_time_budget:
+            deadline = self.time_func() + self.dispatch_time_budget
+
+        while queue:
+            entry = queue[0]
+            messages, offset, future = entry
+            remaining = len(messages) - offset
+
+            if remaining > 0 and not self.closed:
+                step = remaining
 
-                self.close()
+                if budget:
+                    step = min(budget - dispatched, step)
 
+                if deadline:
+                    # check the clock between chunks, `on_messages` still
+                    # gets batches
+                    step = min(self.dispatch_chunk_size, step)
+
+                if offset == 0 and step == remaining:
+                    self.deliver(messages)
+                else:
+                    self.deliver(messages[offset:offset + step])
+
+                entry[1] = offset + step
+                dispatched += step
+                remaining -= step
+
+            if remaining <= 0 or self.closed:
+                queue.popleft()
+                future.set_result(None)
+
+            if not queue:
+                break
+
+            if budget and dispatched >= budget:
+                break
+
+            if deadline and self.time_func() >= deadline:
                 break
 
-    def send(self, message, raw=False):
-        if not raw:
+        if queue:
+            self.dispatch_scheduled = True
+
+            ioloop.IOLoop.current().add_callback(self.run_dispatch)
+
+    def deliver(self, messages):
+        """
+        Hand a list of messages to the conn object.
+        """
+        if not self.conn:
+            return
+
+        try:
+            self.conn.messages_received(messages)
+        except:
+            LOG.exception(self.session_id)
+
+            self.close()
+
+    def allow_outbound(self, count=1, prepared=False):
+        """
+        Account for `count` messages sent to the client against the quota, if
+        any.
+
+        :param prepared: Whether the messages are
+            :ref:`proto.PreparedMessage`s, which are counted but never dropped.
+        :returns: `False` if they are over the rate and must be dropped.
+        """
+        quota = self.quota
+
+        if not quota:
+            return True
+
+        if prepared:
+            quota.count_outbound(count)
+
+            return True
+
+        return quota.allow_outbound(count)
+
+    def send(self, message, raw=False, binary=False,
+             priority=PRIORITY_NORMAL, conflate_key=None):
+        prepared = isinstance(message, proto.PreparedMessage)
+
+        if prepared:
+            if not self.allow_outbound(len(message.messages), prepared=True):
+                return
+        elif not self.allow_outbound():
+            return
+
+        if prepared:
+            self.send_prepared(message, priority, conflate_key)
+
+            return
+
+        if binary:
+            transport = self.send_transport
+
+            if transport and transport.binary:
+                # keep ordering with anything buffered before the transport
+                # was attached
+                self.flush()
+
+                if self.write(message, binary=True):
+                    return
+
+            message = proto.encode_binary(message)
+        elif not raw:
             message = proto.encode(message)
 
-        message = str_to_bytes(message)
+        message = bytes_to_str(message)
+
+        self.send_frame(message, priority=priority, conflate_key=conflate_key)
+
+    def send_prepared(self, prepared, priority=PRIORITY_NORMAL,
+                      conflate_key=None):
+        """
+        Send a :ref:`proto.PreparedMessage`. The transport reuses the frame
+        already encoded for it, if any.
+        """
+        event_id = prepared.event_id
+
+        if self.write(prepared, prepared=True):
+            if event_id:
+                self.last_event_id = event_id
+
+            return
+
+        self.append_to_buffer(prepared.data, priority, conflate_key)
+
+        if event_id:
+            self.buffered_event_id = event_id
+
+    def send_stream(self, chunks):
+        """
+        Send a single, already JSON encoded message that is supplied as an
+        iterable of chunks of the encoded text. If a transport is attached the
+        chunks are written out as they are produced, each one once the
+        previous one has reached the socket, otherwise the message has to be
+        buffered whole. Messages sent in the meantime are buffered behind it.
+        """
+        if not self.allow_outbound():
+            return
+
+        # keep ordering with anything already buffered, note that polling
+        # transports detach once they have sent a frame
+        self.flush()
+
+        if self.backpressure or self.stream_future is not None:
+            self.send_frame(''.join(bytes_to_str(c) for c in chunks))
+
+            return
+
+        transport = self.send_transport
+
+        if not transport:
+            self.append_to_buffer(''.join(bytes_to_str(c) for c in chunks))
 
-        self.send_frame(message)
+            return
+
+        self.stream_future = transport.send_stream(
+            itertools.chain(['a['], chunks, [']'])
+        )
+
+        self.touch()
+
+        self.stream_future.add_done_callback(
+            functools.partial(self.on_stream_done, transport)
+        )
+
+    def on_stream_done(self, transport, future):
+        """
+        Called once `send_stream` has written the message, or failed to.
+        """
+        if future is not self.stream_future:
+            return
+
+        self.stream_future = None
+
+        try:
+            future.result()
+        except (IOError, WebSocketClosedError):
+            return
+        except Exception:
+            LOG.exception('Failed to stream a message to %r', self)
+
+            # part of the frame may be out already, the connection cannot
+            # carry anything else
+            transport.abort_connection()
+
+            return
+
+        self.touch()
+
+        # whatever was sent while the message was being written
+        self.flush()
+
+    def send_multi(self, messages, raw=False, priority=PRIORITY_NORMAL):
+        if not self.allow_outbound(len(messages)):
+            return
 
-    def send_multi(self, messages, raw=False):
         if raw:
             messages = ','.join(messages)
         else:
             messages = proto.encode(messages)
 
-        self.send_frame(messages, multi=True)
+        self.send_frame(messages, multi=True, priority=priority)
 
-    def send_frame(self, data, multi=True):
+    def send_frame(self, data, multi=True, priority=PRIORITY_NORMAL,
+                   conflate_key=None):
         if multi:
             frame = 'a[' + data + ']'
         else:
             frame = 'm' + data
 
         if not self.write(frame):
-            self.append_to_buffer(data)
+            self.append_to_buffer(data, priority, conflate_key)
+
+    def write(self, frame, binary=False, prepared=False, shaped=True):
+        """
+        Write a frame to the transport.
+
+        :param shaped: Whether the frame counts against the shaper, if any.
 
-    def write(self, frame):
-        if not self.send_transport:
+        :returns: `True` if the frame has been dealt with, `False` if it must
+            be buffered.
+        """
+        if not self.send_transport or self.stream_future is not None:
             return False
 
+        backpressure = self.backpressure
+
+        if backpressure:
+            if backpressure == 'pause':
+                backpressure = self.check_pause_limit()
+
+            # the caller buffers the frame, conflated by `append_to_buffer`
+            return backpressure == 'skip' or self.closed
+
+        shaper = self.shaper
+
+        if shaper is not None and shaped and not binary:
+            size = len(frame.data) + 3 if prepared else len(frame)
+
+            if not shaper.admit(self, size):
+                return False
+
         try:
-            self.send_transport.send(frame)
+            if binary:
+                self.send_transport.send_binary(frame)
+            elif prepared:
+                self.send_transport.send_prepared(frame)
+            else:
+                self.send_transport.send(frame)
         except IOError:
             return False
 
         self.touch()
 
+        if self.slow_threshold:
+            self.check_backlog()
+
         return True
 
-    def flush(self):
-        if not self.send_transport:
+    def check_backlog(self):
+        """
+        Mark the session as slow if the transport is not keeping up with what
+        is being written to it.
+        """
+        if self.slow or not self.send_transport:
+            return
+
+        if self.send_transport.write_backlog() <= self.slow_threshold:
+            return
+
+        self.slow = True
+
+        if self.conn:
+            self.conn.session_slow()
+
+    def check_pause_limit(self):
+        """
+        Tell the conn if the buffer of the paused session is full. It may
+        close the session or change its backpressure.
+
+        :returns: The backpressure of the session.
+        """
+        limit = self.pause_limit
+
+        if limit and self.conn and self.buffered_count() >= limit:
+            self.conn.session_overflow()
+
+        return self.backpressure
+
+    def resume(self):
+        """
+        Clear the slow state of the session and flush anything that was held
+        back while it was slow.
+        """
+        self.slow = False
+        self.backpressure = None
+
+        self.flush()
+
+    def flush(self, count=None):
+        """
+        Write the buffered messages to the transport.
+
+        :param count: If set, only the first `count` messages are written.
+        """
+        if not self.send_transport or self.backpressure:
+            # a slow session is flushed by `resume`
+            return
+
+        if self.stream_future is not None:
+            # flushed by `on_stream_done`
             return
 
-        send_buffer = self.get_buffer()
+        taken = self.take_buffer(count)
+        high, normal = taken
 
-        if not send_buffer:
+        if not high and not normal:
             return
 
-        self.send_multi(send_buffer, raw=True)
-        self.clear_buffer()
+        last_event_id = self.last_event_id
+
+        if self.buffered_event_id > last_event_id and not self.get_buffer():
+            # the whole buffer goes out, ids are not tracked per message
+            self.last_event_id = self.buffered_event_id
+
+        # higher priority messages go first
+        if not self.write('a[' + ','.join(high + normal) + ']'):
+            # back where they were, in their own lanes
+            self.last_event_id = last_event_id
+            self.restore_buffer(taken)
+        elif count is None or not self.get_buffer():
+            # forget the conflate keys of what has been written
+            self.clear_buffer()
 
     def send_heartbeat(self):
-        self.write('h')
+        """
+        Keep the session alive. Transports that support pings are pinged
+        unless the strategy is 'frame'. An `h` frame is written unless the
+        strategy is 'ping', or it is 'auto' and the client has already
+        answered a ping.
+
+        :returns: A bitmask of `HEARTBEAT_FRAME` and `HEARTBEAT_PING`.
+        """
+        strategy = self.heartbeat_strategy
+        sent = 0
+
+        if strategy != 'frame' and self.send_ping():
+            sent = HEARTBEAT_PING
+
+            if strategy == 'ping' or self.rtt is not None:
+                return sent
+
+        if self.backpressure:
+            # the frame would not reach a slow client any sooner
+            return sent
+
+        # heartbeats are tiny and must not be held back with the messages
+        if self.write('h', shaped=False):
+            sent |= HEARTBEAT_FRAME
+
+        return sent
+
+    def send_ping(self):
+        """
+        Ping the client, if the transport supports it, so that the round trip
+        time can be measured and a dead peer detected.
+        """
+        transport = self.send_transport
+
+        if not transport or not transport.send_ping():
+            return False
+
+        self.ping_sent()
+
+        return True
 
-    def append_to_buffer(self, frame):
+    def append_to_buffer(self, frame, priority=PRIORITY_NORMAL,
+                         conflate_key=None):
         raise NotImplementedError
 
     def get_buffer(self):
@@ -512,3 +1102,22 @@ class BaseSession(StateMixin, TransportMixin, ExpiryMixin):
 
     def clear_buffer(self):
         raise NotImplementedError
+
+    def buffered_count(self):
+        """
+        Return the number of buffered messages.
+        """
+        return len(self.get_buffer())
+
+    def take_buffer(self, count=None):
+        """
+        Remove the first `count` buffered messages, all of them by default.
+
+        :returns: `(high, normal)`, the lists of messages taken from the high
+            and normal priority buffers. Pass it to `restore_buffer` to put
+            them back.
+        """
+        raise NotImplementedError
+
+    def restore_buffer(self, taken):
+        raise NotImplementedError
@@ -1,9 +1,11 @@
 from heapq import heappush, heappop
+import itertools
 import time
 
 from tornado import ioloop
 
 from sockjs.tornado.log import pool as LOG
+from sockjs.tornado.session.base import HEARTBEAT_FRAME, HEARTBEAT_PING
 
 
 __all__ = [
@@ -14,14 +16,38 @@ __all__ = [
 class SessionPool(object):
     """
     A garbage collected Session Pool.
+
+    Only managed sessions are garbage collected. Unmanaged sessions (e.g.
+    websockets, whose liveness is driven by ping/pong and the TCP close event)
+    are registered so that they can be found and receive heartbeats, but are
+    never visited by `gc` and must be `discard`ed when they close.
+
+    :ivar sessions: A dict of session_id -> session of all sessions.
+    :ivar cycles: A dict of managed session -> time of its last gc cycle.
+    :ivar pool: A heap of `(cycle, session_id, seq, session)` of managed
+        sessions. `seq` is unique, so that sessions are never compared.
+    :ivar heartbeat_timeout: The number of seconds a pong may be late before
+        the session is closed. 0 disables the check.
+    :ivar heartbeat_stretch: Unmanaged sessions only get every nth heartbeat.
+        Managed sessions rely on heartbeats to not expire and get all of them.
+    :ivar pinged: The sessions that were pinged by the last heartbeat and
+        whose pong had not been received by the last gc cycle.
     """
 
-    def __init__(self, gc_delay, heartbeat_delay):
+    def __init__(self, gc_delay, heartbeat_delay, heartbeat_timeout=0,
+                 stats=None):
         self.stopping = False
         self.sessions = {}
         self.cycles = {}
 
         self.pool = []
+        self.pinged = []
+        self.seq = itertools.count()
+
+        self.heartbeat_timeout = heartbeat_timeout
+        self.heartbeat_stretch = 1
+        self.heartbeat_round = 0
+        self.stats = stats
 
         self.gc_periodic_callback = ioloop.PeriodicCallback(
             self.gc,
@@ -38,6 +64,9 @@ class SessionPool(object):
     def set_heartbeat_delay(self, delay):
         self.heartbeat_periodic_callback.callback_time = delay * 1000
 
+    def set_heartbeat_stretch(self, stretch):
+        self.heartbeat_stretch = stretch
+
     def __str__(self):
         return str(self.sessions)
 
@@ -52,6 +81,7 @@ class SessionPool(object):
         self.cycles = {}
 
         self.pool = []
+        self.pinged = []
 
         if not self.gc_periodic_callback.is_running():
             self.gc_periodic_callback.start()
@@ -77,15 +107,25 @@ class SessionPool(object):
             self.pool = None
             self.cycles = None
             self.sessions = None
+            self.pinged = []
 
     def drain(self):
         while self.pool:
-            _, session = heappop(self.pool)
+            session = heappop(self.pool)[-1]
 
             if not session.closed:
                 session.close()
 
-    def add(self, session, time_func=time.time):
+        for session in list(self.sessions.values()):
+            if not session.closed:
+                session.close()
+
+    def add(self, session, time_func=time.time, managed=True):
+        """
+        Add a new session to the pool.
+
+        :param managed: Whether the session should be garbage collected.
+        """
         if self.stopping:
             raise RuntimeError('SessionPool is stopping')
 
@@ -97,10 +137,21 @@ class SessionPool(object):
         if not session.new:
             raise RuntimeError('Session has already expired')
 
-        current_time = self.cycles[session] = time_func()
         self.sessions[session.session_id] = session
 
-        heappush(self.pool, (current_time, session))
+        if not managed:
+            return
+
+        current_time = self.cycles[session] = time_func()
+
+        # a stale entry of a removed session may have the same time and id,
+        # the sequence number breaks the tie before the sessions are compared
+        heappush(self.pool, (
+            current_time,
+            session.session_id,
+            next(self.seq),
+            session,
+        ))
 
     def get(self, session_id):
         """
@@ -108,19 +159,25 @@ class SessionPool(object):
         """
         return self.sessions.get(session_id, None)
 
+    def discard(self, session):
+        """
+        Forget a closed, unmanaged session. Managed sessions are left for `gc`
+        to reap.
+        """
+        if not self.sessions or session in self.cycles:
+            return
+
+        if self.sessions.get(session.session_id) is session:
+            del self.sessions[session.session_id]
+
     def remove(self, session_id):
         session = self.sessions.pop(session_id, None)
 
         if not session:
             return False
 
-        current_time = self.cycles.pop(session, None)
-
-        if current_time:
-            try:
-                self.pool.remove((current_time, session))
-            except ValueError:
-                pass
+        # the heap entry is lazily discarded by the next gc cycle
+        self.cycles.pop(session, None)
 
         try:
             session.close()
@@ -135,20 +192,29 @@ class SessionPool(object):
         collection iteration. This data-structure is time-independent so we
         sessions can be added to and from without the need to lock the pool.
         """
+        current_time = time_func()
+
+        if self.pinged:
+            self.check_pongs(current_time)
+
         if not self.pool:
             return
 
-        current_time = time_func()
-
         while self.pool:
-            session = self.pool[0][1]
-            cycle = self.cycles[session]
+            session = self.pool[0][-1]
+            cycle = self.cycles.get(session)
+
+            if cycle is None:
+                # removed since the last cycle
+                heappop(self.pool)
+
+                continue
 
             if cycle >= current_time:
                 # we've looped through all sessions
                 break
 
-            last_checked, session = heappop(self.pool)
+            session = heappop(self.pool)[-1]
 
             if session.has_expired(current_time):
                 # Session is to be GC'd immediately
@@ -158,11 +224,79 @@ class SessionPool(object):
 
             # Flag the session with the id of this GC cycle
             self.cycles[session] = current_time
-            heappush(self.pool, (current_time, session))
+            heappush(self.pool, (
+                current_time,
+                session.session_id,
+                next(self.seq),
+                session,
+            ))
+
+    def check_pongs(self, current_time):
+        """
+        Close the pinged sessions whose pong is more than `heartbeat_timeout`
+        seconds overdue.
+        """
+        timeout = self.heartbeat_timeout
+
+        if not timeout:
+            self.pinged = []
+
+            return
+
+        waiting = []
+        dead = []
+
+        for session in self.pinged:
+            if session.closed or session.ping_sent_at is None:
+                continue
+
+            if session.pong_overdue(timeout, current_time):
+                dead.append(session)
+            else:
+                waiting.append(session)
+
+        self.pinged = waiting
+
+        for session in dead:
+            if self.stats:
+                self.stats.on_pong_timeout()
+
+            try:
+                session.close(3000, 'Ping timeout')
+            except Exception:
+                LOG.exception('Failed to close session %r', session)
 
     def heartbeat(self, time_func=time.time):
         """
         Send a heartbeat ping to all the connected sessions.
         """
+        pinged = []
+        frames = pings = 0
+
+        self.heartbeat_round += 1
+
+        skip_unmanaged = self.heartbeat_round % self.heartbeat_stretch
+        cycles = self.cycles
+
         for session in self.sessions.values():
-            session.send_heartbeat()
+            if skip_unmanaged and session not in cycles:
+                if session.ping_sent_at is not None:
+                    pinged.append(session)
+
+                continue
+
+            sent = session.send_heartbeat()
+
+            if sent & HEARTBEAT_FRAME:
+                frames += 1
+
+            if sent & HEARTBEAT_PING:
+                pings += 1
+
+            if session.ping_sent_at is not None:
+                pinged.append(session)
+
+        self.pinged = pinged
+
+        if self.stats:
+            self.stats.on_heartbeat(frames, pings)
@@ -0,0 +1,244 @@
+"""
+Outbound rate shaping. Smooths the egress of sessions that receive bursts
+of messages (e.g. broadcasts) by holding back whatever exceeds their token
+buckets in the session buffer.
+"""
+
+from tornado import ioloop
+
+
+__all__ = [
+    'TokenBucket',
+    'Shaper',
+]
+
+
+class TokenBucket(object):
+    """
+    A token bucket that fills at `rate` tokens per second, up to `burst`
+    tokens.
+    """
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now):
+        elapsed = now - self.updated
+
+        if elapsed > 0:
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+
+class Shaper(object):
+    """
+    Limits the rate at which messages are written to the sessions of an
+    endpoint, in bytes and/or messages per second.
+
+    A write that does not fit in the buckets of its session is refused and
+    the message stays in the session buffer. From then on everything sent to
+    the session is buffered, so that order is preserved, and a single timer
+    shared by all the held sessions releases their buffers as the buckets
+    refill.
+
+    Binary frames and raw websocket sessions are not shaped.
+
+    :ivar byte_rate: Bytes per second per session, 0 is unlimited.
+    :ivar byte_burst: Size in bytes of each session's byte bucket.
+    :ivar message_rate: Messages per second per session, 0 is unlimited.
+    :ivar message_burst: Size of each session's message bucket.
+    :ivar interval: Seconds between releases of the held sessions.
+    :ivar held: The sessions with messages held back.
+    """
+
+    def __init__(self, byte_rate, byte_burst, message_rate, message_burst,
+                 interval, stats=None):
+        self.byte_rate = byte_rate
+        self.byte_burst = byte_burst or byte_rate
+        self.message_rate = message_rate
+        self.message_burst = message_burst or message_rate
+        self.interval = interval
+        self.stats = stats
+
+        self.held = set()
+        self.timeout = None
+        self.releasing = False
+
+    def attach(self, session):
+        """
+        Shape the writes to `session`.
+        """
+        now = session.time_func()
+
+        session.shaper = self
+
+        if self.byte_rate:
+            session.byte_bucket = TokenBucket(
+                self.byte_rate,
+                self.byte_burst,
+                now,
+            )
+
+        if self.message_rate:
+            session.message_bucket = TokenBucket(
+                self.message_rate,
+                self.message_burst,
+                now,
+            )
+
+    def detach(self, session):
+        """
+        Forget a closed session.
+        """
+        self.held.discard(session)
+
+        if not self.held:
+            self.stop_timer()
+
+    def admit(self, session, size):
+        """
+        Called before a frame of `size` bytes is written to `session`.
+
+        :returns: `True` if the frame may be written, `False` if it has to be
+            buffered.
+        """
+        if self.releasing:
+            # tokens were taken by `release`
+            return True
+
+        if session in self.held:
+            # e.g. a poller that has come back, the timer may be stopped
+            self.schedule()
+
+            return False
+
+        if self.take(session, [size]):
+            return True
+
+        self.hold(session)
+
+        if self.stats:
+            self.stats.on_shaped(size)
+
+        return False
+
+    def take(self, session, sizes):
+        """
+        Take tokens for as many of the messages of `sizes` as the buckets of
+        `session` allow, in order.
+
+        :returns: The number of messages the tokens were taken for.
+        """
+        now = session.time_func()
+        count = len(sizes)
+
+        messages = session.message_bucket
+
+        if messages:
+            messages.refill(now)
+
+            count = min(count, int(messages.tokens))
+
+        taken = 0
+
+        byte_bucket = session.byte_bucket
+
+        if byte_bucket:
+            byte_bucket.refill(now)
+
+            tokens = byte_bucket.tokens
+
+            for i in range(count):
+                size = sizes[i]
+
+                # a message larger than the burst goes out on a full bucket
+                if taken + size > tokens and (
+                        i or tokens < byte_bucket.burst):
+                    count = i
+
+                    break
+
+                taken += size
+
+            byte_bucket.tokens -= taken
+
+        if messages:
+            messages.tokens -= count
+
+        return count
+
+    def hold(self, session):
+        self.held.add(session)
+
+        self.schedule()
+
+    def schedule(self):
+        if self.timeout is None:
+            self.timeout = ioloop.IOLoop.current().call_later(
+                self.interval,
+                self.release,
+            )
+
+    def stop_timer(self):
+        if self.timeout is not None:
+            ioloop.IOLoop.current().remove_timeout(self.timeout)
+            self.timeout = None
+
+    def release(self):
+        """
+        Write out as much of the buffer of each held session as its buckets
+        allow.
+        """
+        self.timeout = None
+
+        # whether a held session can be released on a later run
+        pending = False
+
+        for session in list(self.held):
+            if session.closed:
+                self.held.discard(session)
+
+                continue
+
+            if not session.send_transport:
+                # a polling session, `admit` restarts the timer once it is
+                # back
+                continue
+
+            send_buffer = session.get_buffer()
+
+            if not send_buffer:
+                self.held.discard(session)
+
+                continue
+
+            # +1 for the separating comma
+            count = self.take(session, [len(d) + 1 for d in send_buffer])
+
+            if count == len(send_buffer):
+                self.held.discard(session)
+            else:
+                pending = True
+
+            if not count:
+                continue
+
+            self.releasing = True
+
+            try:
+                session.flush(count)
+            finally:
+                self.releasing = False
+
+        if pending:
+            self.schedule()
+
+    def stop(self):
+        self.stop_timer()
+
+        self.held = set()
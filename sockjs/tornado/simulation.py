@@ -0,0 +1,423 @@
+"""
+Deterministic, virtual-time simulation of the session lifecycle.
+
+Drives a :ref:`SessionPool` (garbage collection, heartbeats and expiry) and a
+population of sessions with a fake clock and fake transports. No sockets or
+IOLoop are involved so a simulated hour for a million sessions completes in
+seconds, which makes it possible to measure the CPU cost of the pool and try
+out new scheduling strategies before deploying them.
+
+Example::
+
+    sim = Simulator(sessions=1000000, polling_ratio=0.1)
+    report = sim.run(3600)
+"""
+
+from heapq import heappush, heappop
+import gc as _gc
+import random
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from sockjs.tornado import session as sockjs_session
+
+try:
+    cpu_time = time.process_time
+except AttributeError:
+    cpu_time = time.clock
+
+
+__all__ = [
+    'FakeTransport',
+    'Simulator',
+    'VirtualClock',
+]
+
+
+class VirtualClock(object):
+    """
+    A clock that only moves forward when told to, running any callbacks that
+    have been scheduled along the way in order.
+
+    :ivar now: The current virtual time in seconds since the epoch. The default
+        start is well past 1e9 as :ref:`ExpiryMixin.set_expiry` treats smaller
+        values as deltas.
+    """
+
+    def __init__(self, start=1500000000.0):
+        self.now = start
+        self.events = []
+        self.seq = 0
+
+    def time(self):
+        return self.now
+
+    def call_at(self, when, callback, *args):
+        """
+        Schedule `callback(*args)` to run when the clock reaches `when`.
+        Returns a handle that can be passed to :ref:`cancel`.
+        """
+        self.seq += 1
+
+        handle = [when, self.seq, callback, args]
+        heappush(self.events, handle)
+
+        return handle
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self.now + delay, callback, *args)
+
+    def cancel(self, handle):
+        # lazily removed when popped
+        handle[2] = None
+
+    def advance(self, seconds):
+        """
+        Move the clock forward by `seconds`, running all due callbacks.
+        """
+        self.run_until(self.now + seconds)
+
+    def run_until(self, deadline):
+        events = self.events
+
+        while events and events[0][0] <= deadline:
+            when, _, callback, args = heappop(events)
+
+            if callback is None:
+                continue
+
+            self.now = max(self.now, when)
+            callback(*args)
+
+        self.now = max(self.now, deadline)
+
+
+class ConnectionInfo(object):
+    """
+    Stand in for :ref:`sockjs.tornado.transport.base.ConnectionInfo`.
+    """
+
+    ip = '127.0.0.1'
+    cookies = {}
+    arguments = {}
+    headers = {}
+    path = '/'
+
+
+class FakeTransport(object):
+    """
+    Implements the `ITransport` interface without touching the network.
+
+    :ivar polling: If `True`, the transport detaches from the session after
+        each frame it sends, like xhr/jsonp polling.
+    :ivar alive: If `False`, the peer has silently gone away. Frames are still
+        accepted (the kernel buffers them) but nothing is ever received.
+    """
+
+    sendable = True
+    binary = False
+
+    def __init__(self, simulator, polling=False):
+        self.simulator = simulator
+        self.polling = polling
+        self.recvable = not polling
+        self.alive = True
+        self.session = None
+
+        self.name = 'xhr' if polling else 'websocket'
+
+    def send(self, frame):
+        self.simulator.frames_sent += 1
+        self.simulator.bytes_sent += len(frame)
+
+        if self.polling:
+            self.detach_session()
+
+    def send_ping(self):
+        if self.polling:
+            return False
+
+        if self.alive:
+            self.simulator.clock.call_later(self.simulator.rtt, self.pong)
+
+        return True
+
+    def pong(self):
+        if self.alive and self.session:
+            self.session.pong_received()
+
+    def attach(self, session):
+        session.attach_transport(self)
+
+        self.session = session
+
+    def detach_session(self):
+        session, self.session = self.session, None
+
+        if not session:
+            return
+
+        session.detach_transport(self)
+        session.set_expiry(self.simulator.disconnect_delay)
+
+        if self.alive:
+            self.simulator.schedule_poll(self, session)
+
+    def session_closed(self, session):
+        self.session = None
+        self.alive = False
+
+
+class SimConnection(object):
+    """
+    Minimal connection object that a session can be bound to.
+    """
+
+    __slots__ = ('simulator', 'session')
+
+    def __init__(self, simulator, session):
+        self.simulator = simulator
+        self.session = session
+
+    def session_opened(self, conn_info):
+        self.simulator.sessions_opened += 1
+
+    def session_closed(self):
+        self.simulator.session_closed(self.session)
+
+    def messages_received(self, messages):
+        pass
+
+
+class Simulator(object):
+    """
+    Runs a population of simulated clients against a session pool.
+
+    Websocket clients keep their transport attached for the lifetime of the
+    session and answer pings after `rtt` seconds. Polling clients re-attach
+    `poll_delay` seconds after each frame they receive. Every second, `churn`
+    of the clients go away, half of them cleanly (the session is closed) and
+    half silently (the peer stops responding). Each departed client
+    reconnects as a brand new session after `reconnect_delay` seconds,
+    keeping the population steady.
+
+    :cvar session_class: The session implementation to simulate.
+    :cvar session_pool_class: The session pool implementation to simulate.
+    """
+
+    session_class = sockjs_session.Session
+    session_pool_class = sockjs_session.SessionPool
+
+    def __init__(self, sessions=10000, polling_ratio=0.1, churn=0.001,
+                 heartbeat_delay=25, heartbeat_timeout=5, disconnect_delay=5,
+                 gc_delay=1, poll_delay=0.05, reconnect_delay=1, rtt=0.05,
+                 seed=0, clock=None, pool=None):
+        self.sessions = sessions
+        self.polling_ratio = polling_ratio
+        self.churn = churn
+        self.heartbeat_delay = heartbeat_delay
+        self.disconnect_delay = disconnect_delay
+        self.gc_delay = gc_delay
+        self.poll_delay = poll_delay
+        self.reconnect_delay = reconnect_delay
+        self.rtt = rtt
+
+        self.ttl = heartbeat_delay + heartbeat_timeout
+        self.random = random.Random(seed)
+        self.clock = clock or VirtualClock()
+
+        if pool is None:
+            pool = self.session_pool_class(
+                gc_delay,
+                heartbeat_delay,
+                heartbeat_timeout=heartbeat_timeout,
+            )
+
+        self.pool = pool
+
+        self.live = []
+        self.next_id = 0
+
+        self.sessions_created = 0
+        self.sessions_opened = 0
+        self.sessions_closed = 0
+        self.frames_sent = 0
+        self.bytes_sent = 0
+
+        self.gc_calls = 0
+        self.gc_cpu = 0.0
+        self.gc_cpu_max = 0.0
+        self.heartbeat_calls = 0
+        self.heartbeat_cpu = 0.0
+        self.heartbeat_cpu_max = 0.0
+
+    def create_session(self):
+        """
+        Create, register and open a new session with a connected client.
+        """
+        self.next_id += 1
+        self.sessions_created += 1
+
+        sess = self.session_class(
+            str(self.next_id),
+            self.ttl,
+            time_func=self.clock.time,
+        )
+        sess.bind(SimConnection(self, sess))
+        sess.set_conn_info(ConnectionInfo)
+
+        polling = self.random.random() < self.polling_ratio
+
+        # mirrors `Endpoint.create_session`, websockets are not gc'd
+        self.pool.add(sess, time_func=self.clock.time, managed=polling)
+        transport = FakeTransport(self, polling=polling)
+
+        # same order as `BaseTransport.bind_session`
+        transport.attach(sess)
+        transport.send('o')
+        sess.open()
+
+        self.live.append((sess, transport))
+
+        return sess
+
+    def schedule_poll(self, transport, session):
+        self.clock.call_later(self.poll_delay, self.poll, transport, session)
+
+    def poll(self, transport, session):
+        if not transport.alive or session.closed:
+            return
+
+        transport.attach(session)
+        session.flush()
+
+    def session_closed(self, session):
+        self.sessions_closed += 1
+
+        self.pool.discard(session)
+
+    def depart(self):
+        """
+        Remove a random client, cleanly or silently, and schedule it to come
+        back as a new session.
+        """
+        live = self.live
+
+        if not live:
+            return
+
+        # swap remove keeps this O(1)
+        idx = self.random.randrange(len(live))
+        live[idx], live[-1] = live[-1], live[idx]
+        sess, transport = live.pop()
+
+        if self.random.random() < 0.5:
+            sess.close()
+        else:
+            transport.alive = False
+
+        self.clock.call_later(self.reconnect_delay, self.create_session)
+
+    def run_gc(self):
+        start = cpu_time()
+        self.pool.gc(time_func=self.clock.time)
+        elapsed = cpu_time() - start
+
+        self.gc_calls += 1
+        self.gc_cpu += elapsed
+        self.gc_cpu_max = max(self.gc_cpu_max, elapsed)
+
+        self.clock.call_later(self.gc_delay, self.run_gc)
+
+    def run_heartbeat(self):
+        start = cpu_time()
+        self.pool.heartbeat(time_func=self.clock.time)
+        elapsed = cpu_time() - start
+
+        self.heartbeat_calls += 1
+        self.heartbeat_cpu += elapsed
+        self.heartbeat_cpu_max = max(self.heartbeat_cpu_max, elapsed)
+
+        self.clock.call_later(self.heartbeat_delay, self.run_heartbeat)
+
+    def run_churn(self):
+        departures = int(len(self.live) * self.churn)
+
+        # carry fractional departures over probabilistically
+        if self.random.random() < len(self.live) * self.churn - departures:
+            departures += 1
+
+        for _ in range(departures):
+            self.depart()
+
+        self.clock.call_later(1, self.run_churn)
+
+    def populate(self):
+        for _ in range(self.sessions):
+            self.create_session()
+
+    def run(self, duration, measure_memory=False):
+        """
+        Populate the pool and run the simulation for `duration` virtual
+        seconds.
+
+        :param measure_memory: If `True` and `tracemalloc` is available, the
+            peak memory used while populating the pool is reported.
+        :returns: A dict of counters and timings.
+        """
+        wall_start = time.time()
+        memory = None
+
+        if measure_memory and tracemalloc:
+            _gc.collect()
+            tracemalloc.start()
+
+        self.populate()
+
+        if measure_memory and tracemalloc:
+            memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        self.clock.call_later(self.gc_delay, self.run_gc)
+        self.clock.call_later(self.heartbeat_delay, self.run_heartbeat)
+        self.clock.call_later(1, self.run_churn)
+
+        self.clock.advance(duration)
+
+        return self.report(
+            simulated=duration,
+            wall=time.time() - wall_start,
+            memory=memory,
+        )
+
+    def report(self, **extra):
+        # silently departed websocket clients that are still holding a session
+        zombies = 0
+
+        for sess in self.pool.sessions.values():
+            if not sess.closed and sess.send_transport:
+                if not sess.send_transport.alive:
+                    zombies += 1
+
+        data = dict(
+            sessions_created=self.sessions_created,
+            sessions_opened=self.sessions_opened,
+            sessions_closed=self.sessions_closed,
+            sessions_pooled=len(self.pool.sessions),
+            sessions_zombie=zombies,
+            frames_sent=self.frames_sent,
+            bytes_sent=self.bytes_sent,
+            gc_calls=self.gc_calls,
+            gc_cpu=self.gc_cpu,
+            gc_cpu_max=self.gc_cpu_max,
+            heartbeat_calls=self.heartbeat_calls,
+            heartbeat_cpu=self.heartbeat_cpu,
+            heartbeat_cpu_max=self.heartbeat_cpu_max,
+        )
+        data.update(extra)
+
+        return data
@@ -1,3 +1,4 @@
+from bisect import bisect_left
 from collections import deque
 
 from tornado import ioloop
@@ -50,6 +51,10 @@ class MovingAverage(object):
             self.last_average = self.sum / float(streamlen)
 
 
+# upper bounds, in milliseconds, of the round trip time histogram buckets
+RTT_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
 class StatsCollector(object):
     def __init__(self, delay=1):
         # Sessions
@@ -66,6 +71,38 @@ class StatsCollector(object):
         self.pack_sent_ps = MovingAverage()
         self.pack_recv_ps = MovingAverage()
 
+        # Inbound batching
+        self.batch_pending = 0
+        self.batch_dropped = 0
+        self.batch_ps = MovingAverage()
+        self.batch_messages_ps = MovingAverage()
+
+        # Liveness
+        self.rtt_sum = MovingAverage()
+        self.rtt_count = MovingAverage()
+        self.rtt_histogram = [0] * (len(RTT_BUCKETS) + 1)
+        self.pong_timeouts = 0
+        self.heartbeat_frames = 0
+        self.heartbeat_pings = 0
+
+        # Slow consumers
+        self.sess_slow = 0
+        self.sess_slow_total = 0
+        self.sess_evicted = 0
+
+        # Outbound shaping
+        self.shaped_frames = 0
+        self.shaped_bytes = 0
+
+        # Overload
+        self.overload_level = 0
+        self.loop_lag = 0.0
+        self.overload_rejected = 0
+
+        # Quota, reported as `quota_*`
+        self.quota = None
+        self.broadcasts_dropped = 0
+
         self._callback = ioloop.PeriodicCallback(
             self._update,
             delay * 1000,
@@ -85,6 +122,12 @@ class StatsCollector(object):
         self.pack_sent_ps.flush()
         self.pack_recv_ps.flush()
 
+        self.batch_ps.flush()
+        self.batch_messages_ps.flush()
+
+        self.rtt_sum.flush()
+        self.rtt_count.flush()
+
     def dump(self):
         """Return dictionary with current statistical information"""
         data = dict(
@@ -97,9 +140,48 @@ class StatsCollector(object):
 
             # Packets
             packets_sent_ps=self.pack_sent_ps.last_average,
-            packets_recv_ps=self.pack_recv_ps.last_average
+            packets_recv_ps=self.pack_recv_ps.last_average,
+
+            # Inbound batching
+            batch_pending=self.batch_pending,
+            batch_dropped=self.batch_dropped,
+            batches_ps=self.batch_ps.last_average,
+            batch_messages_ps=self.batch_messages_ps.last_average,
+            batch_size_avg=self.batch_size_average(),
+
+            # Liveness
+            rtt_avg=self.rtt_average(),
+            pong_timeouts=self.pong_timeouts,
+            heartbeat_frames=self.heartbeat_frames,
+            heartbeat_pings=self.heartbeat_pings,
+
+            # Slow consumers
+            sessions_slow=self.sess_slow,
+            sessions_slow_total=self.sess_slow_total,
+            sessions_evicted=self.sess_evicted,
+
+            # Outbound shaping
+            shaped_frames=self.shaped_frames,
+            shaped_bytes=self.shaped_bytes,
+
+            # Overload
+            overload_level=self.overload_level,
+            loop_lag_ms=self.loop_lag * 1000,
+            overload_rejected=self.overload_rejected,
+
+            # Quota
+            broadcasts_dropped=self.broadcasts_dropped,
         )
 
+        for bound, count in zip(RTT_BUCKETS, self.rtt_histogram):
+            data['rtt_le_%dms' % (bound,)] = count
+
+        data['rtt_gt_%dms' % (RTT_BUCKETS[-1],)] = self.rtt_histogram[-1]
+
+        if self.quota:
+            for k, v in self.quota.usage().items():
+                data['quota_' + k] = v
+
         for k, v in self.sess_transports.items():
             data['transp_' + k] = v
 
@@ -130,3 +212,93 @@ class StatsCollector(object):
 
     def on_pack_recv(self, num):
         self.pack_recv_ps.add(num)
+
+    def on_batch_queued(self, num):
+        self.batch_pending += num
+
+    def on_batch_done(self, num):
+        self.batch_pending -= num
+
+    def on_batch_dropped(self, num):
+        self.batch_dropped += num
+
+    def on_batch(self, num):
+        self.batch_ps.add(1)
+        self.batch_messages_ps.add(num)
+
+    def on_rtt(self, rtt):
+        """
+        `rtt`
+            Round trip time of a ping in seconds
+        """
+        ms = rtt * 1000
+
+        self.rtt_sum.add(ms)
+        self.rtt_count.add(1)
+        self.rtt_histogram[bisect_left(RTT_BUCKETS, ms)] += 1
+
+    def on_sess_slow(self):
+        self.sess_slow += 1
+        self.sess_slow_total += 1
+
+    def on_sess_resumed(self):
+        self.sess_slow -= 1
+
+    def on_sess_evicted(self):
+        self.sess_slow_total += 1
+        self.sess_evicted += 1
+
+    def on_shaped(self, size):
+        """
+        `size`
+            Size in bytes of a frame that was held back by rate shaping
+        """
+        self.shaped_frames += 1
+        self.shaped_bytes += size
+
+    def on_overload(self, level, lag):
+        """
+        `level`
+            Current overload level
+        `lag`
+            Smoothed IOLoop lag in seconds
+        """
+        self.overload_level = level
+        self.loop_lag = lag
+
+    def on_overload_rejected(self):
+        self.overload_rejected += 1
+
+    def on_broadcast_dropped(self):
+        self.broadcasts_dropped += 1
+
+    def on_pong_timeout(self):
+        self.pong_timeouts += 1
+
+    def on_heartbeat(self, frames, pings):
+        """
+        `frames`
+            Number of `h` frames sent by a heartbeat
+        `pings`
+            Number of pings sent by a heartbeat
+        """
+        self.heartbeat_frames += frames
+        self.heartbeat_pings += pings
+
+    def batch_size_average(self):
+        """Average number of messages per batch over the moving window"""
+        count = self.batch_ps.last_average
+
+        if not count:
+            return 0
+
+        return self.batch_messages_ps.last_average / count
+
+    def rtt_average(self):
+        """Average round trip time in milliseconds over the moving window"""
+        count = self.rtt_count.last_average
+
+        if not count:
+            return 0
+
+        return self.rtt_sum.last_average / count
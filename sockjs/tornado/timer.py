@@ -0,0 +1,289 @@
+"""
+A hierarchical timer wheel, so that many per-session timers share a single
+IOLoop timeout instead of each adding one to the IOLoop heap.
+"""
+
+import time
+
+from tornado import ioloop
+
+from sockjs.tornado.log import core as LOG
+
+
+__all__ = [
+    'Timer',
+    'TimerWheel',
+]
+
+
+class Timer(object):
+    """
+    A callback scheduled on a :ref:`TimerWheel`.
+
+    :ivar expires: The tick the timer fires at.
+    """
+
+    __slots__ = ('wheel', 'expires', 'callback', 'args', 'slot', 'owner')
+
+    def __init__(self, wheel, expires, callback, args, owner=None):
+        self.wheel = wheel
+        self.expires = expires
+        self.callback = callback
+        self.args = args
+        self.slot = None
+        self.owner = owner
+
+    @property
+    def active(self):
+        return self.slot is not None
+
+    def cancel(self):
+        """
+        Cancel the timer, a no-op if it has already fired.
+        """
+        slot = self.slot
+
+        if slot is not None:
+            slot.discard(self)
+            self.slot = None
+
+            self.wheel.count -= 1
+
+            if self.owner is not None:
+                self.owner.timer_done(self)
+
+
+class TimerWheel(object):
+    """
+    Timers are kept in `levels` wheels of `slots` slots each. A slot of level
+    0 holds the timers of one tick of `resolution` seconds, a slot of level n
+    those of `slots ** n` ticks, which are moved down a level as their time
+    comes closer. Scheduling and cancelling are O(1) and the wheel only runs
+    an IOLoop timeout while it has timers, for the next tick at which a
+    timer fires or timers are moved down.
+
+    Timers fire up to `resolution` seconds late, never early.
+
+    :ivar tick: The last tick that has been run.
+    :ivar count: The number of pending timers.
+    :ivar wakeup: The tick the IOLoop timeout is set for.
+    """
+
+    def __init__(self, resolution=0.1, slots=64, levels=4, time_func=None):
+        self.resolution = resolution
+        self.slots = slots
+        self.levels = levels
+        self.time_func = time_func or time.time
+
+        self.wheels = [
+            [set() for _ in range(slots)]
+            for _ in range(levels)
+        ]
+        # timers beyond the range of the top level
+        self.overflow = set()
+        self.span = slots ** levels
+
+        self.origin = self.time_func()
+        self.tick = 0
+        self.count = 0
+        self.timeout = None
+        self.wakeup = None
+
+    def current_tick(self):
+        # the epsilon absorbs float rounding, which would otherwise make a
+        # timeout set for the start of a tick wake up just before it
+        return int((self.time_func() - self.origin) / self.resolution + 1e-9)
+
+    def call_later(self, delay, callback, *args, **kwargs):
+        """
+        Run `callback(*args)` after `delay` seconds.
+
+        :param owner: An object with a `timer_done(timer)` method that is
+            called once the timer has fired or been cancelled.
+        :returns: The :ref:`Timer`, which can be cancelled.
+        """
+        owner = kwargs.pop('owner', None)
+
+        if not self.count:
+            # nothing is pending, skip the idle ticks
+            self.tick = self.current_tick()
+
+        # round up, timers never fire early
+        ticks = -(-(self.time_func() + delay - self.origin) //
+                  self.resolution)
+
+        timer = Timer(
+            self,
+            max(int(ticks), self.tick + 1),
+            callback,
+            args,
+            owner,
+        )
+
+        self.place(timer)
+
+        self.count += 1
+
+        if self.timeout is None or timer.expires < self.wakeup:
+            self.schedule()
+
+        return timer
+
+    def place(self, timer):
+        delta = timer.expires - self.tick
+        slots = self.slots
+        span = 1
+
+        for wheel in self.wheels:
+            if delta < span * slots:
+                slot = wheel[(timer.expires // span) % slots]
+
+                break
+
+            span *= slots
+        else:
+            slot = self.overflow
+
+        slot.add(timer)
+        timer.slot = slot
+
+    def next_tick(self):
+        """
+        Return the next tick at which timers fire or are moved down a level,
+        the ticks in between have nothing to do.
+        """
+        tick = self.tick
+        slots = self.slots
+        wheels = self.wheels
+
+        best = None
+
+        # the timers of level 0 all expire within the next `slots` ticks
+        for t in range(tick + 1, tick + slots):
+            if wheels[0][t % slots]:
+                best = t
+
+                break
+
+        if self.overflow:
+            span = self.span
+            boundary = (tick // span + 1) * span
+
+            if best is None or boundary < best:
+                best = boundary
+
+        for level in range(1, self.levels):
+            span = slots ** level
+            boundary = (tick // span + 1) * span
+
+            # the boundaries of the higher levels are no earlier
+            if best is not None and boundary >= best:
+                break
+
+            for _ in range(slots):
+                if best is not None and boundary >= best:
+                    break
+
+                if wheels[level][(boundary // span) % slots]:
+                    best = boundary
+
+                    break
+
+                boundary += span
+
+        if best is None:
+            return tick + 1
+
+        return best
+
+    def schedule(self):
+        io_loop = ioloop.IOLoop.current()
+
+        if self.timeout is not None:
+            io_loop.remove_timeout(self.timeout)
+
+        self.wakeup = self.next_tick()
+
+        deadline = self.origin + self.wakeup * self.resolution
+
+        self.timeout = io_loop.call_later(
+            max(deadline - self.time_func(), 0),
+            self.run,
+        )
+
+    def run(self):
+        self.timeout = None
+
+        target = self.current_tick()
+
+        while self.count:
+            tick = self.next_tick()
+
+            if tick > target:
+                break
+
+            self.tick = tick
+
+            self.cascade()
+            self.fire(self.wheels[0][tick % self.slots])
+
+        if self.count:
+            self.schedule()
+
+    def cascade(self):
+        """
+        Move the timers of the slots of the higher levels that start at the
+        current tick down to the lower levels, highest level first.
+        """
+        tick = self.tick
+        slots = self.slots
+
+        if not tick % self.span and self.overflow:
+            self.replace(self.overflow)
+
+        for level in range(self.levels - 1, 0, -1):
+            span = slots ** level
+
+            if tick % span:
+                continue
+
+            self.replace(self.wheels[level][(tick // span) % slots])
+
+    def replace(self, slot):
+        timers = list(slot)
+        slot.clear()
+
+        for timer in timers:
+            self.place(timer)
+
+    def fire(self, slot):
+        if not slot:
+            return
+
+        timers = list(slot)
+        slot.clear()
+
+        for timer in timers:
+            timer.slot = None
+
+            self.count -= 1
+
+            if timer.owner is not None:
+                timer.owner.timer_done(timer)
+
+            try:
+                timer.callback(*timer.args)
+            except Exception:
+                LOG.exception('Timer callback failed')
+
+    def stop(self):
+        """
+        Cancel every pending timer.
+        """
+        if self.timeout is not None:
+            ioloop.IOLoop.current().remove_timeout(self.timeout)
+            self.timeout = None
+
+        for slot in [self.overflow] + [s for w in self.wheels for s in w]:
+            for timer in list(slot):
+                timer.cancel()
@@ -1,9 +1,13 @@
+from tornado import gen
+from tornado import ioloop
 from tornado import web
 
 from sockjs.tornado import handler
 from sockjs.tornado.log import transport as LOG
+from sockjs.tornado.util import bytes_to_str
 from sockjs.tornado.util import json_decode
 from sockjs.tornado.util import str_to_bytes
+from sockjs.tornado.util import write_backlog
 from sockjs.tornado import proto
 
 try:
@@ -15,6 +19,9 @@ __all__ = [
     'BaseTransport',
 ]
 
+# close reason sent to new sessions while the endpoint is overloaded
+OVERLOADED = (1013, 'Try again later')
+
 
 class ConnectionInfo(object):
     """Connection information object.
@@ -83,11 +90,21 @@ class BaseTransport(handler.BaseHandler):
     # set to true if the transport provides writing capabilities from the
     # connection (aka the client receives packets from the server)
     sendable = False
+    # set to true if the transport can deliver binary frames to the client
+    binary = False
 
     @property
     def verify_ip(self):
         return self.sockjs_settings['verify_ip']
 
+    @property
+    def frame_cache_key(self):
+        """
+        Identifies the frame encoding of this transport. Frames of prepared
+        messages are memoized under this key.
+        """
+        return self.name
+
     def prepare(self):
         super(BaseTransport, self).prepare()
 
@@ -128,6 +145,14 @@ class BaseTransport(handler.BaseHandler):
         session = self.get_session(session_id)
 
         if not session and self.sendable:
+            if not self.endpoint.accepting_sessions:
+                if self.stats:
+                    self.stats.on_overload_rejected()
+
+                self.send_close_frame(OVERLOADED)
+
+                return False
+
             session = self.create_session(session_id)
 
             session.set_conn_info(self.get_conn_info())
@@ -233,13 +258,77 @@ class BaseTransport(handler.BaseHandler):
 
         self.send_raw(frame)
 
+    def send_prepared(self, prepared):
+        """
+        Send a :ref:`proto.PreparedMessage`, reusing the encoded frame from any
+        earlier send over the same kind of transport.
+        """
+        self.send_raw(prepared.get_frame(
+            self.frame_cache_key,
+            lambda data: str_to_bytes(self.encode_frame('a[' + data + ']')),
+        ))
+
+    @gen.coroutine
+    def send_stream(self, chunks):
+        """
+        Send an encoded message that is supplied as an iterable of chunks,
+        writing each chunk out as it is produced rather than building the
+        frame in memory. The next chunk is only pulled once the previous one
+        has been flushed to the socket.
+
+        :returns: A future that resolves once the whole frame has been written.
+        """
+        for data in self.encode_stream(chunks):
+            yield self.write_raw(data)
+
     def send_raw(self, data):
+        self.write_raw(data)
+
+    def write_raw(self, data):
         self.write(str_to_bytes(data))
-        self.flush()
+
+        return self.flush()
+
+    def send_binary(self, data):
+        """
+        Send a binary message to the client, unframed. Only called if
+        `binary` is set.
+        """
+        raise NotImplementedError
+
+    def send_ping(self):
+        """
+        Send a transport level ping to the client. Only websockets have them.
+        """
+        return False
+
+    def write_backlog(self):
+        """
+        The number of bytes written to the client that are still waiting to
+        be sent on the socket.
+        """
+        return write_backlog(getattr(self.request.connection, 'stream', None))
+
+    def abort_connection(self):
+        """
+        Drop the connection without finishing the response, e.g. after a
+        frame could only be written in part.
+        """
+        self.request.connection.close()
+
+        # closing it clears the close callback, this is not called otherwise
+        self.on_connection_close()
 
     def encode_frame(self, data):
         return data
 
+    def encode_stream(self, chunks):
+        """
+        Chunked version of `encode_frame`, yields the encoded frame piece by
+        piece.
+        """
+        return chunks
+
     def on_connection_close(self):
         super(BaseTransport, self).on_connection_close()
 
@@ -279,10 +368,14 @@ class SingleRecvTransport(BaseTransport):
             raise web.HTTPError(500, "Broken JSON encoding.")
 
         try:
+            if self.sockjs_settings['raw_passthrough']:
+                return proto.split_frame(bytes_to_str(data))
+
             return json_decode(data)
         except:
             raise web.HTTPError(500, "Broken JSON encoding.")
 
+    @gen.coroutine
     def post(self, session_id):
         self.response_preamble()
 
@@ -299,7 +392,7 @@ class SingleRecvTransport(BaseTransport):
             raise
 
         try:
-            self.session.dispatch(messages)
+            future = self.session.dispatch(messages)
         except:
             LOG.exception('Failed to dispatch %r', messages)
 
@@ -307,14 +400,52 @@ class SingleRecvTransport(BaseTransport):
 
             raise web.HTTPError(500)
 
+        if future:
+            # only respond once everything has been dispatched
+            yield future
+
 
 class PollingTransport(BaseTransport):
+    def attach_session(self, session_id):
+        delay = self.endpoint.poll_delay
+
+        if delay:
+            session = self.get_session(session_id)
+
+            if session and session.opened:
+                # let messages accumulate so that they go out in fewer,
+                # larger responses
+                ioloop.IOLoop.current().call_later(
+                    delay,
+                    self.attach_delayed,
+                    session_id,
+                )
+
+                return True
+
+        return super(PollingTransport, self).attach_session(session_id)
+
+    def attach_delayed(self, session_id):
+        if self._finished or not self.endpoint:
+            # the client has gone away
+            return
+
+        if not super(PollingTransport, self).attach_session(session_id):
+            self.safe_finish()
+
     def send_raw(self, data):
         super(PollingTransport, self).send_raw(data)
 
         self.detach_session()
         self.safe_finish()
 
+    @gen.coroutine
+    def send_stream(self, chunks):
+        yield super(PollingTransport, self).send_stream(chunks)
+
+        self.detach_session()
+        self.safe_finish()
+
 
 class StreamingTransport(BaseTransport):
     sendable = True
@@ -337,10 +468,26 @@ class StreamingTransport(BaseTransport):
 
         return False
 
+    def write_raw(self, data):
+        future = super(StreamingTransport, self).write_raw(data)
+
+        self.amount_limit -= len(data)
+
+        return future
+
     def send_raw(self, data):
         super(StreamingTransport, self).send_raw(data)
 
-        self.amount_limit -= len(data)
+        if not self.should_finish():
+            return
+
+        self.finish()
+
+    @gen.coroutine
+    def send_stream(self, chunks):
+        # the limit is only checked once the whole frame has been written, a
+        # message is never split across responses
+        yield super(StreamingTransport, self).send_stream(chunks)
 
         if not self.should_finish():
             return
@@ -9,9 +9,17 @@
 from tornado import web
 
 from sockjs.tornado.transport import base
+from sockjs.tornado.util import str_to_bytes
 
 
 class EventSourceTransport(base.StreamingTransport):
+    """
+    Each event carries the history id of the newest recorded broadcast it
+    delivers (see the `history_size` setting), so that the browser sends it
+    back as `Last-Event-ID` when it reconnects.
+
+    :ivar last_event_id: The newest event id sent on this response.
+    """
     name = 'eventsource'
 
     cors = True
@@ -19,6 +27,8 @@ class EventSourceTransport(base.StreamingTransport):
     cache = False
     content_type = 'text/event-stream'
 
+    last_event_id = 0
+
     @web.asynchronous
     def get(self, session_id):
         self.response_preamble()
@@ -30,4 +40,44 @@ class EventSourceTransport(base.StreamingTransport):
             self.safe_finish()
 
     def encode_frame(self, frame):
-        return b'data: %s\r\n\r\n' % (frame,)
+        return b'data: ' + str_to_bytes(frame) + b'\r\n\r\n'
+
+    def encode_event_id(self, event_id):
+        return str_to_bytes('id: %d\r\n' % (event_id,))
+
+    def send(self, data):
+        event_id = self.session.last_event_id if self.session else 0
+
+        if event_id <= self.last_event_id:
+            super(EventSourceTransport, self).send(data)
+
+            return
+
+        self.last_event_id = event_id
+
+        self.send_raw(self.encode_event_id(event_id) + self.encode_frame(data))
+
+    def send_prepared(self, prepared):
+        event_id = prepared.event_id
+
+        if not event_id:
+            super(EventSourceTransport, self).send_prepared(prepared)
+
+            return
+
+        self.last_event_id = max(self.last_event_id, event_id)
+
+        # the id belongs to the message, so the frame can still be shared
+        self.send_raw(prepared.get_frame(
+            self.frame_cache_key,
+            lambda data: self.encode_event_id(event_id) + str_to_bytes(
+                self.encode_frame('a[' + data + ']')),
+        ))
+
+    def encode_stream(self, chunks):
+        yield b'data: '
+
+        for chunk in chunks:
+            yield chunk
+
+        yield b'\r\n\r\n'
@@ -9,6 +9,7 @@
 from tornado import web
 
 from sockjs.tornado.transport import base
+from sockjs.tornado.util import bytes_to_str
 from sockjs.tornado.util import json_encode
 
 __all__ = [
@@ -61,3 +62,12 @@ class HtmlFileTransport(base.StreamingTransport):
             # only used to escape strings
             json_encode(frame)
         )
+
+    def encode_stream(self, chunks):
+        yield b'<script>\np("'
+
+        for chunk in chunks:
+            # escape each chunk as the inside of a JSON string
+            yield json_encode(bytes_to_str(chunk))[1:-1]
+
+        yield b'");\n</script>\r\n'
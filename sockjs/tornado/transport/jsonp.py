@@ -5,9 +5,11 @@
 
     JSONP transport implementation.
 """
+from tornado import gen
 from tornado import web
 
 from sockjs.tornado.transport import base
+from sockjs.tornado.util import bytes_to_str
 from sockjs.tornado.util import json_encode
 
 
@@ -29,11 +31,33 @@ class JSONPTransport(base.PollingTransport):
             self.safe_finish()
 
     def encode_frame(self, frame):
+        return self.wrap_frame(json_encode(frame))
+
+    def wrap_frame(self, payload):
         return '/**/%s(%s);\r\n' % (
             self.js_callback,
-            json_encode(frame)
+            payload
+        )
+
+    def send_prepared(self, prepared):
+        # every session has its own callback, only the escaped frame is
+        # shared
+        payload = prepared.get_frame(
+            self.frame_cache_key,
+            lambda data: json_encode('a[' + data + ']'),
         )
 
+        self.send_raw(self.wrap_frame(payload))
+
+    def encode_stream(self, chunks):
+        yield '/**/%s("' % (self.js_callback,)
+
+        for chunk in chunks:
+            # escape each chunk as the inside of a JSON string
+            yield json_encode(bytes_to_str(chunk))[1:-1]
+
+        yield '");\r\n'
+
 
 class JSONPSendTransport(base.SingleRecvTransport):
     name = 'jsonp_send'
@@ -43,8 +67,9 @@ class JSONPSendTransport(base.SingleRecvTransport):
     cache = False
     content_type = 'text/plain'
 
+    @gen.coroutine
     def post(self, session_id):
-        super(JSONPSendTransport, self).post(session_id)
+        yield super(JSONPSendTransport, self).post(session_id)
 
         self.set_header('Content-Length', '2')
         self.write('ok')
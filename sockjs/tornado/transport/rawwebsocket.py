@@ -6,39 +6,263 @@
     Raw websocket transport implementation
 """
 
+import functools
+import itertools
+
+from tornado import ioloop
+
+from sockjs.tornado.handler.websocket import WebSocketClosedError
 from sockjs.tornado.log import transport as LOG
+from sockjs.tornado import proto
 from sockjs.tornado import session
 from sockjs.tornado.transport import websocket
+from sockjs.tornado.util import bytes_to_str
 
 
 class RawWebSocket(session.Session):
-    def __init__(self):
-        super(RawWebSocket, self).__init__('raw', 0)
+    """
+    Session for raw websocket connections. Messages are not SockJS framed, each
+    one is written to the socket as is.
+
+    Outgoing messages are buffered and written out by `flush`. While a previous
+    write is still waiting on the socket, new messages stay in the buffer and
+    are written together once it completes.
+
+    :ivar delimiter: If set, consecutive text messages in the buffer are
+        coalesced into a single frame joined by this string. Otherwise each
+        message is written as its own frame.
+    :ivar immediate_flush: If `False`, the buffer is flushed on the next
+        IOLoop iteration instead of on every send.
+
+    The buffer is bounded by the `send_buffer_limit` and
+    `priority_buffer_limit` settings like that of any session. Messages whose
+    write fails are put back in the buffer.
+
+    While the session is slow (see `BaseSession.backpressure`) nothing is
+    written, messages are buffered, dropped or conflated in the buffer.
+    """
+
+    # raw websockets have no session id of their own
+    ids = itertools.count(1)
+
+    def __init__(self, delimiter=None, immediate_flush=True):
+        super(RawWebSocket, self).__init__('raw-%d' % (next(self.ids),), 0)
+
+        self.delimiter = delimiter
+        self.immediate_flush = immediate_flush
+
+        self.flush_pending = False
+        self.write_future = None
+
+    def send(self, data, raw=False, binary=False,
+             priority=session.base.PRIORITY_NORMAL, conflate_key=None):
+        if isinstance(data, proto.PreparedMessage):
+            # frames are not shared with SockJS sessions, write the JSON text
+            # of each message
+            frames = [(msg.data, False) for msg in data.messages]
+
+            if not self.allow_outbound(len(frames), prepared=True):
+                return
+        else:
+            frames = [(data, binary)]
+
+            if not self.allow_outbound():
+                return
+
+        self.buffer(frames, priority, conflate_key)
+        self.send_buffered()
+
+    def buffer(self, frames, priority=session.base.PRIORITY_NORMAL,
+               conflate_key=None):
+        backpressure = self.backpressure
+
+        if backpressure == 'pause':
+            backpressure = self.check_pause_limit()
+
+        if backpressure == 'skip' or self.closed:
+            return
+
+        # conflated by `append_to_buffer`
+        for frame in frames:
+            self.append_to_buffer(frame, priority, conflate_key)
 
-    def send(self, data, **kwargs):
-        self.write(data)
+    def send_buffered(self):
+        if self.immediate_flush:
+            self.flush()
+
+            return
+
+        if not self.flush_pending:
+            self.flush_pending = True
+
+            ioloop.IOLoop.current().add_callback(self.flush)
+
+    def send_heartbeat(self):
+        # raw clients would take an `h` frame for a message
+        if self.send_ping():
+            return session.base.HEARTBEAT_PING
+
+        return 0
 
     def send_frame(self, data, **kwargs):
-        self.write(data)
+        self.send(data)
+
+    def send_multi(self, messages, raw=False,
+                   priority=session.base.PRIORITY_NORMAL):
+        if not self.allow_outbound(len(messages)):
+            return
+
+        # no framing, each message goes out on its own
+        self.buffer([(message, False) for message in messages], priority)
+        self.send_buffered()
+
+    def send_stream(self, chunks):
+        if not self.allow_outbound():
+            return
+
+        self.flush()
+
+        transport = self.send_transport
+
+        if (not transport or self.get_buffer() or self.backpressure or
+                self.stream_future is not None):
+            # queued behind earlier messages, has to be buffered whole
+            self.buffer([(''.join(bytes_to_str(c) for c in chunks), False)])
+            self.send_buffered()
+
+            return
+
+        # `flush` waits on it like on any other write
+        self.stream_future = self.write_future = transport.send_stream(chunks)
+
+        self.touch()
+
+        self.stream_future.add_done_callback(
+            functools.partial(self.on_stream_done, transport)
+        )
 
-    def get_buffer(self):
-        return []
+    def flush(self):
+        self.flush_pending = False
+
+        transport = self.send_transport
+
+        send_buffer = self.get_buffer()
+
+        if not transport or not send_buffer:
+            return
+
+        if self.write_future and not self.write_future.done():
+            # socket backpressure, resumes in `on_write_done`
+            return
+
+        if self.backpressure:
+            # slow session, resumes in `resume`
+            return
+
+        taken = self.take_buffer()
+        high, normal = taken
+
+        future = None
+        written = 0
+
+        try:
+            for data, binary, count in self.coalesce(high + normal):
+                if binary:
+                    future = transport.send_binary(data)
+                else:
+                    future = transport.send(data)
+
+                written += count
+        except (IOError, WebSocketClosedError):
+            # keep what has not been written, in its own lane
+            self.restore_buffer((
+                high[written:],
+                normal[max(written - len(high), 0):],
+            ))
+
+            return
+
+        if not self.get_buffer():
+            # forget the conflate keys of what has been written
+            self.clear_buffer()
+
+        self.touch()
+
+        if future:
+            self.write_future = future
+
+            future.add_done_callback(self.on_write_done)
+
+        if self.slow_threshold:
+            self.check_backlog()
+
+    def on_write_done(self, future):
+        if future is not self.write_future:
+            return
+
+        self.write_future = None
+
+        if self.get_buffer():
+            self.flush()
+
+    def coalesce(self, messages):
+        """
+        Return a list of `(data, binary, count)` frames to write for the
+        buffered `messages`, `count` being the number of messages in the
+        frame.
+        """
+        delimiter = self.delimiter
+
+        if not delimiter:
+            return [(data, binary, 1) for data, binary in messages]
+
+        frames = []
+        run = []
+
+        for data, binary in messages:
+            if not binary:
+                run.append(bytes_to_str(data))
+
+                continue
+
+            if run:
+                frames.append((delimiter.join(run), False, len(run)))
+                run = []
+
+            frames.append((data, True, 1))
+
+        if run:
+            frames.append((delimiter.join(run), False, len(run)))
+
+        return frames
 
 
 class RawWebSocketTransport(websocket.WebSocketTransport):
     """Raw Websocket transport"""
     name = 'raw-websocket'
 
+    # raw websockets are unframed so binary frames are always available
+    binary = True
+
     def open(self, *args, **kwargs):
         super(RawWebSocketTransport, self).open('raw-websocket')
 
     def create_session(self, session_id):
-        sess = RawWebSocket()
+        sess = RawWebSocket(
+            delimiter=self.sockjs_settings['raw_websocket_delimiter'],
+            immediate_flush=self.sockjs_settings['immediate_flush'],
+        )
+
+        self.endpoint.configure_session(sess)
 
         conn = self.endpoint.create_connection(sess)
 
         sess.bind(conn)
 
+        # unmanaged, like websocket sessions: the pool heartbeat pings them
+        # and times out their pongs, they leave it in `session_closed`
+        self.endpoint.session_pool.add(sess, managed=False)
+
         return sess
 
     def on_message(self, message):
@@ -61,4 +285,7 @@ class RawWebSocketTransport(websocket.WebSocketTransport):
         pass
 
     def send(self, data):
-        self.write_message(data)
+        return self.write_message(data)
+
+    def send_binary(self, data):
+        return self.write_message(data, binary=True)
@@ -7,9 +7,11 @@
 """
 
 from sockjs.tornado.handler import websocket
+from sockjs.tornado import proto
 from sockjs.tornado.transport import base
 from sockjs.tornado.util import bytes_to_str
 from sockjs.tornado.util import json_decode
+from sockjs.tornado.util import write_backlog
 
 from sockjs.tornado.log import transport as LOG
 
@@ -24,16 +26,49 @@ class WebSocketTransport(websocket.WebSocketHandler,
 
     @property
     def ping_interval(self):
-        return self.sockjs_settings['heartbeat_delay']
+        # pings are sent by the session pool heartbeat, which also times out
+        # the pongs
+        return None
+
+    @property
+    def binary(self):
+        return self.sockjs_settings['websocket_binary']
 
     def send_raw(self, data):
         self.write_message(data)
 
+    def send_binary(self, data):
+        self.write_message(data, binary=True)
+
+    def send_ping(self):
+        try:
+            self.ping(b'')
+        except websocket.WebSocketClosedError:
+            return False
+
+        return True
+
+    def write_backlog(self):
+        conn = self.ws_connection
+
+        if conn is None:
+            return 0
+
+        return write_backlog(conn.stream)
+
+    def send_stream(self, chunks):
+        return self.write_fragments(self.encode_stream(chunks))
+
     def on_finish(self):
         # override existing on_finish routines
         # this is on purpose a no-op
         pass
 
+    def create_session(self, session_id):
+        # liveness is driven by ping/pong and on_close, there is no need for
+        # the session pool to garbage collect the session
+        return self.endpoint.create_session(session_id, managed=False)
+
     def open(self, session_id):
         self.stats.on_conn_opened()
 
@@ -41,13 +76,32 @@ class WebSocketTransport(websocket.WebSocketHandler,
         if self.sockjs_settings['disable_nagle']:
             self.stream.set_nodelay(True)
 
+        if not self.endpoint.accepting_sessions:
+            self.stats.on_overload_rejected()
+            self.close(*base.OVERLOADED)
+
+            return
+
         # Handle session
         session = self.create_session(session_id)
 
         session.conn_info = self.get_conn_info()
 
-        if not self.bind_session(session):
-            self.close(*session.close_reason)
+        try:
+            bound = self.bind_session(session)
+        except Exception:
+            LOG.exception('Failed to open session')
+
+            session.close()
+
+            bound = False
+
+        if not bound:
+            # the pool does not garbage collect websocket sessions, a session
+            # that failed to open has to be forgotten here
+            self.endpoint.session_closed(session)
+
+            self.close(*(session.close_reason or (3000, 'Go away!')))
 
     def on_message(self, message):
         if not message:
@@ -61,8 +115,17 @@ class WebSocketTransport(websocket.WebSocketHandler,
 
             return
 
+        if isinstance(message, bytes) and self.binary:
+            # binary frames are not SockJS framed, pass them through as is
+            self.dispatch_binary(message)
+
+            return
+
         try:
-            msg = json_decode(bytes_to_str(message))
+            if self.sockjs_settings['raw_passthrough']:
+                msg = proto.split_frame(bytes_to_str(message))
+            else:
+                msg = json_decode(bytes_to_str(message))
         except Exception:
             LOG.error('Failed to decode %r', message)
 
@@ -82,6 +145,14 @@ class WebSocketTransport(websocket.WebSocketHandler,
 
             return
 
+    def dispatch_binary(self, message):
+        try:
+            self.session.dispatch([message])
+        except Exception:
+            LOG.exception('Failed to dispatch binary message')
+
+            self.close()
+
     def on_close(self):
         self.stats.on_conn_closed()
 
@@ -94,7 +165,17 @@ class WebSocketTransport(websocket.WebSocketHandler,
         self.close(*session.close_reason)
 
     def on_pong(self, data):
-        self.session.touch()
+        session = self.session
+
+        if not session:
+            return
+
+        session.touch()
+
+        rtt = session.pong_received()
+
+        if rtt is not None:
+            self.stats.on_rtt(rtt)
 
     def send_close_frame(self, close_reason):
         try:
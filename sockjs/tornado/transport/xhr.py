@@ -5,6 +5,7 @@
 
     Xhr-Polling transport implementation
 """
+from tornado import gen
 from tornado import web
 
 from sockjs.tornado.transport import base
@@ -36,6 +37,12 @@ class XhrPollingTransport(base.PollingTransport):
     def encode_frame(self, data):
         return data + '\n'
 
+    def encode_stream(self, chunks):
+        for chunk in chunks:
+            yield chunk
+
+        yield '\n'
+
 
 class XhrSendTransport(base.SingleRecvTransport):
     name = 'xhr_send'
@@ -45,8 +52,9 @@ class XhrSendTransport(base.SingleRecvTransport):
     cache = False
     content_type = 'text/plain'
 
+    @gen.coroutine
     def post(self, session_id):
-        super(XhrSendTransport, self).post(session_id)
+        yield super(XhrSendTransport, self).post(session_id)
 
         self.set_status(204)
         # have to force the flush otherwise tornado will clear the
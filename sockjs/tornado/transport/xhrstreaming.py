@@ -35,3 +35,9 @@ class XhrStreamingTransport(base.StreamingTransport):
 
     def encode_frame(self, frame):
         return frame + '\n'
+
+    def encode_stream(self, chunks):
+        for chunk in chunks:
+            yield chunk
+
+        yield '\n'
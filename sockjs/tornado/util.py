@@ -23,6 +23,7 @@ __all__ = [
     'json_decode',
     'str_to_bytes',
     'bytes_to_str',
+    'write_backlog',
 ]
 
 
@@ -49,3 +50,18 @@ def str_to_bytes(s):
         return s
 
     return s.encode('utf-8')
+
+
+def write_backlog(stream):
+    """
+    Return the number of bytes written to a tornado `IOStream` that have not
+    yet been accepted by the socket.
+    """
+    if stream is None or stream.closed():
+        return 0
+
+    try:
+        # tornado >= 5
+        return stream._total_write_index - stream._total_write_done_index
+    except AttributeError:
+        return getattr(stream, '_write_buffer_size', 0)
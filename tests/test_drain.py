@@ -0,0 +1,87 @@
+from sockjs.tornado.drain import Drainer
+
+import virtual
+
+
+class FakeSession(object):
+    def __init__(self, endpoint, session_id):
+        self.endpoint = endpoint
+        self.session_id = session_id
+        self.closed = False
+        self.close_reason = None
+
+    def close(self, code, reason):
+        self.closed = True
+        self.close_reason = (code, reason)
+
+        del self.endpoint.active_sessions[self.session_id]
+
+
+class FakeEndpoint(object):
+    def __init__(self, count):
+        self.active_sessions = {}
+
+        for i in range(count):
+            self.active_sessions[i] = FakeSession(self, i)
+
+
+class DrainerTestCase(virtual.VirtualTimeTestCase):
+    def test_batches(self):
+        endpoint = FakeEndpoint(25)
+        sessions = list(endpoint.active_sessions.values())
+
+        drainer = Drainer(endpoint, 10, 1, 3001, 'Drain', 0)
+
+        # 10 batches over 10 seconds
+        self.assertEqual(drainer.batch_size, 3)
+
+        future = drainer.start()
+
+        self.assertEqual(len(endpoint.active_sessions), 22)
+
+        remaining = []
+
+        for _ in range(8):
+            self.clock.advance(1)
+
+            remaining.append(len(endpoint.active_sessions))
+
+        self.assertEqual(remaining, [19, 16, 13, 10, 7, 4, 1, 0])
+        self.assertTrue(future.done())
+        self.assertIsNone(drainer.timeout)
+
+        for sess in sessions:
+            self.assertEqual(sess.close_reason, (3001, 'Drain; reconnect=0'))
+
+    def test_late_sessions(self):
+        endpoint = FakeEndpoint(2)
+
+        drainer = Drainer(endpoint, 2, 1, 3001, 'Drain', 0)
+        future = drainer.start()
+
+        # opened while the drain was in progress
+        endpoint.active_sessions['late'] = FakeSession(endpoint, 'late')
+
+        self.clock.advance(1)
+
+        self.assertFalse(future.done())
+
+        self.clock.advance(1)
+
+        self.assertEqual(endpoint.active_sessions, {})
+        self.assertTrue(future.done())
+
+    def test_stop(self):
+        endpoint = FakeEndpoint(10)
+
+        drainer = Drainer(endpoint, 10, 1, 3001, 'Drain', 0)
+        future = drainer.start()
+
+        drainer.stop()
+
+        self.assertTrue(future.done())
+
+        self.clock.advance(10)
+
+        # only the first batch was closed
+        self.assertEqual(len(endpoint.active_sessions), 9)
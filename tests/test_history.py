@@ -0,0 +1,57 @@
+import unittest
+
+from sockjs.tornado import proto
+from sockjs.tornado.history import History
+
+
+class HistoryTestCase(unittest.TestCase):
+    def make_history(self, size, ids):
+        topic_history = History(size)
+
+        for event_id in ids:
+            topic_history.append(proto.PreparedMessage(
+                str(event_id),
+                raw=True,
+                event_id=event_id,
+            ))
+
+        return topic_history
+
+    def ids(self, messages):
+        return [message.event_id for message in messages]
+
+    def test_empty(self):
+        topic_history = History(3)
+
+        self.assertEqual(len(topic_history), 0)
+        self.assertEqual(topic_history.last_id, 0)
+        self.assertEqual(topic_history.since(0), [])
+
+    def test_since(self):
+        topic_history = self.make_history(5, [1, 2, 3])
+
+        self.assertEqual(self.ids(topic_history.since(0)), [1, 2, 3])
+        self.assertEqual(self.ids(topic_history.since(2)), [3])
+        self.assertEqual(topic_history.since(3), [])
+        self.assertEqual(topic_history.last_id, 3)
+
+    def test_eviction(self):
+        topic_history = self.make_history(3, [1, 2, 3, 4, 5])
+
+        self.assertEqual(len(topic_history), 3)
+        self.assertEqual(topic_history.evicted_id, 2)
+        self.assertEqual(topic_history.last_id, 5)
+
+        self.assertEqual(self.ids(topic_history.since(2)), [3, 4, 5])
+        self.assertEqual(self.ids(topic_history.since(4)), [5])
+
+        # 2 is gone
+        self.assertIsNone(topic_history.since(1))
+
+    def test_sparse_ids(self):
+        # the ids of an endpoint are shared by all of its topics
+        topic_history = self.make_history(3, [10, 20, 30, 40])
+
+        self.assertEqual(self.ids(topic_history.since(15)), [20, 30, 40])
+        self.assertEqual(self.ids(topic_history.since(10)), [20, 30, 40])
+        self.assertIsNone(topic_history.since(5))
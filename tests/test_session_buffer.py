@@ -0,0 +1,152 @@
+import unittest
+
+from sockjs.tornado import session
+from sockjs.tornado.quota import Quota
+from sockjs.tornado.session.base import PRIORITY_HIGH
+
+
+class SessionBufferTestCase(unittest.TestCase):
+    def make_session(self, **attrs):
+        sess = session.Session('test', 10)
+
+        for name, value in attrs.items():
+            setattr(sess, name, value)
+
+        return sess
+
+
+class ConflateTestCase(SessionBufferTestCase):
+    def test_replace_in_place(self):
+        sess = self.make_session()
+
+        sess.send('a', conflate_key='k')
+        sess.send('b')
+        sess.send('c', conflate_key='k')
+
+        self.assertEqual(sess.get_buffer(), ['"c"', '"b"'])
+
+    def test_other_priority(self):
+        sess = self.make_session()
+
+        sess.send('a', conflate_key='k')
+        sess.send('b', conflate_key='k', priority=PRIORITY_HIGH)
+
+        self.assertEqual(sess.get_buffer(), ['"b"', '"a"'])
+
+        # the key now points at the high priority lane
+        sess.send('c', conflate_key='k')
+
+        self.assertEqual(sess.get_buffer(), ['"b"', '"a"', '"c"'])
+
+    def test_dropped_entry(self):
+        sess = self.make_session(send_buffer_limit=2)
+
+        sess.send('a', conflate_key='k')
+        sess.send('b')
+        # pushes `a` out
+        sess.send('c')
+
+        self.assertEqual(sess.get_buffer(), ['"b"', '"c"'])
+
+        sess.send('d', conflate_key='k')
+
+        self.assertEqual(sess.get_buffer(), ['"c"', '"d"'])
+
+        # the index follows the new entry
+        sess.send('e', conflate_key='k')
+
+        self.assertEqual(sess.get_buffer(), ['"c"', '"e"'])
+
+    def test_positions_after_take(self):
+        sess = self.make_session()
+
+        sess.send('a', conflate_key='k1')
+        sess.send('b', conflate_key='k2')
+
+        self.assertEqual(sess.take_buffer(1), ([], ['"a"']))
+
+        sess.send('c', conflate_key='k2')
+
+        self.assertEqual(sess.get_buffer(), ['"c"'])
+
+        # `a` has been taken, so is not replaced
+        sess.send('d', conflate_key='k1')
+
+        self.assertEqual(sess.get_buffer(), ['"c"', '"d"'])
+
+    def test_positions_after_restore(self):
+        sess = self.make_session()
+
+        sess.send('a')
+        sess.send('b', conflate_key='k')
+
+        sess.restore_buffer(sess.take_buffer())
+
+        sess.send('c', conflate_key='k')
+
+        self.assertEqual(sess.get_buffer(), ['"a"', '"c"'])
+
+
+class TakeBufferTestCase(SessionBufferTestCase):
+    def fill(self, sess):
+        sess.send('n1')
+        sess.send('h1', priority=PRIORITY_HIGH)
+        sess.send('n2')
+        sess.send('h2', priority=PRIORITY_HIGH)
+
+    def test_take_all(self):
+        sess = self.make_session()
+        self.fill(sess)
+
+        taken = sess.take_buffer()
+
+        self.assertEqual(taken, (['"h1"', '"h2"'], ['"n1"', '"n2"']))
+        self.assertEqual(sess.get_buffer(), [])
+        self.assertEqual(sess.buffered_count(), 0)
+
+    def test_take_count(self):
+        sess = self.make_session()
+        self.fill(sess)
+
+        # high priority first
+        self.assertEqual(sess.take_buffer(1), (['"h1"'], []))
+        self.assertEqual(sess.take_buffer(2), (['"h2"'], ['"n1"']))
+        self.assertEqual(sess.get_buffer(), ['"n2"'])
+
+    def test_restore(self):
+        sess = self.make_session()
+        self.fill(sess)
+
+        taken = sess.take_buffer(3)
+
+        sess.send('n3')
+        sess.send('h3', priority=PRIORITY_HIGH)
+
+        sess.restore_buffer(taken)
+
+        # back in front of their own lanes
+        self.assertEqual(sess.priority_buffer, ['"h1"', '"h2"', '"h3"'])
+        self.assertEqual(sess.send_buffer, ['"n1"', '"n2"', '"n3"'])
+        self.assertEqual(sess.send_buffer_dropped, 0)
+        self.assertEqual(sess.priority_buffer_dropped, 0)
+
+    def test_quota(self):
+        quota = Quota(max_buffered_bytes=100)
+        sess = self.make_session(quota=quota)
+        self.fill(sess)
+
+        self.assertEqual(quota.buffered_bytes, 16)
+        self.assertEqual(sess.buffered_bytes, 16)
+
+        taken = sess.take_buffer(3)
+
+        self.assertEqual(quota.buffered_bytes, 4)
+
+        sess.restore_buffer(taken)
+
+        self.assertEqual(quota.buffered_bytes, 16)
+
+        sess.clear_buffer()
+
+        self.assertEqual(quota.buffered_bytes, 0)
+        self.assertEqual(sess.buffered_bytes, 0)
@@ -0,0 +1,66 @@
+from sockjs.tornado import session
+from sockjs.tornado.shaper import Shaper
+
+import virtual
+
+
+class ShaperTestCase(virtual.VirtualTimeTestCase):
+    def make_session(self, shaper):
+        sess = session.Session('test', 10, time_func=self.clock.time)
+        transport = virtual.RecordingTransport()
+
+        sess.attach_transport(transport)
+        shaper.attach(sess)
+
+        return sess, transport
+
+    def test_partial_release(self):
+        shaper = Shaper(0, 0, 2, 2, 0.5)
+        sess, transport = self.make_session(shaper)
+
+        for i in range(5):
+            sess.send(i)
+
+        # the burst goes out, the rest is held back
+        self.assertEqual(transport.frames, ['a[0]', 'a[1]'])
+        self.assertEqual(sess.get_buffer(), ['2', '3', '4'])
+        self.assertIn(sess, shaper.held)
+
+        # one token per half second
+        self.clock.advance(0.5)
+
+        self.assertEqual(transport.frames[2:], ['a[2]'])
+        self.assertEqual(sess.get_buffer(), ['3', '4'])
+        self.assertIn(sess, shaper.held)
+
+        # sent while held, queued behind the buffer
+        sess.send(5)
+
+        self.assertEqual(sess.get_buffer(), ['3', '4', '5'])
+
+        self.clock.advance(1)
+
+        self.assertEqual(transport.frames[3:], ['a[3]', 'a[4]'])
+
+        self.clock.advance(0.5)
+
+        self.assertEqual(transport.frames[5:], ['a[5]'])
+        self.assertEqual(sess.get_buffer(), [])
+        self.assertNotIn(sess, shaper.held)
+        self.assertIsNone(shaper.timeout)
+
+    def test_byte_rate(self):
+        # frames of 4 bytes
+        shaper = Shaper(8, 8, 0, 0, 1)
+        sess, transport = self.make_session(shaper)
+
+        for i in range(4):
+            sess.send(i)
+
+        self.assertEqual(transport.frames, ['a[0]', 'a[1]'])
+
+        self.clock.advance(1)
+
+        # released messages cost their size plus the separating comma
+        self.assertEqual(transport.frames[2:], ['a[2,3]'])
+        self.assertNotIn(sess, shaper.held)
@@ -0,0 +1,89 @@
+from sockjs.tornado.timer import TimerWheel
+
+import virtual
+
+
+class TimerWheelTestCase(virtual.VirtualTimeTestCase):
+    def make_wheel(self):
+        # level 0 covers 4 ticks, level 1 16, beyond that the overflow
+        return TimerWheel(
+            resolution=1,
+            slots=4,
+            levels=2,
+            time_func=self.clock.time,
+        )
+
+    def test_cascade(self):
+        wheel = self.make_wheel()
+        fired = []
+
+        def callback(name):
+            fired.append((name, self.elapsed()))
+
+        wheel.call_later(2.5, callback, 'level 0')
+        wheel.call_later(9, callback, 'level 1')
+        wheel.call_later(40, callback, 'overflow')
+
+        self.assertEqual(wheel.count, 3)
+        self.assertEqual(len(wheel.overflow), 1)
+
+        self.clock.advance(60)
+
+        self.assertEqual(fired, [
+            ('level 0', 3),
+            ('level 1', 9),
+            ('overflow', 40),
+        ])
+        self.assertEqual(wheel.count, 0)
+        self.assertIsNone(wheel.timeout)
+
+    def test_idle_ticks(self):
+        wheel = self.make_wheel()
+        wakeups = []
+
+        run = wheel.run
+
+        def record():
+            wakeups.append(self.elapsed())
+            run()
+
+        wheel.run = record
+
+        wheel.call_later(40, lambda: None)
+
+        self.clock.advance(60)
+
+        # only wakes up at the boundaries of the overflow, to move the timer
+        # down once it is within range of level 1, and to fire it
+        self.assertEqual(wakeups, [16, 32, 40])
+
+    def test_cancel_before_cascade(self):
+        wheel = self.make_wheel()
+        fired = []
+
+        timer = wheel.call_later(9, fired.append, 'cancelled')
+        wheel.call_later(10, fired.append, 'kept')
+
+        self.clock.advance(5)
+
+        timer.cancel()
+
+        self.assertFalse(timer.active)
+        self.assertEqual(wheel.count, 1)
+
+        self.clock.advance(10)
+
+        self.assertEqual(fired, ['kept'])
+
+    def test_never_early(self):
+        wheel = self.make_wheel()
+        fired = []
+
+        self.clock.advance(0.7)
+
+        wheel.call_later(1, lambda: fired.append(self.elapsed()))
+
+        self.clock.advance(5)
+
+        self.assertEqual(len(fired), 1)
+        self.assertTrue(1.7 <= fired[0] <= 2.7)
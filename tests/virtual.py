@@ -0,0 +1,80 @@
+"""
+Helpers to run the code under test against the virtual clock of
+:ref:`sockjs.tornado.simulation`, instead of the wall clock and a real IOLoop.
+"""
+
+import unittest
+
+from tornado import ioloop
+
+from sockjs.tornado import simulation
+
+
+class VirtualLoop(object):
+    """
+    Stands in for the IOLoop, the timeouts it is given run on a
+    :ref:`simulation.VirtualClock`.
+    """
+
+    def __init__(self, clock):
+        self.clock = clock
+
+    def time(self):
+        return self.clock.time()
+
+    def call_later(self, delay, callback, *args):
+        return self.clock.call_later(delay, callback, *args)
+
+    def add_callback(self, callback, *args):
+        return self.clock.call_later(0, callback, *args)
+
+    def remove_timeout(self, timeout):
+        self.clock.cancel(timeout)
+
+
+class RecordingTransport(object):
+    """
+    A send transport that keeps the frames written to it.
+    """
+
+    sendable = True
+    recvable = False
+    binary = False
+
+    def __init__(self):
+        self.frames = []
+
+    def send(self, frame):
+        self.frames.append(frame)
+
+    def send_ping(self):
+        return False
+
+    def write_backlog(self):
+        return 0
+
+
+class VirtualTimeTestCase(unittest.TestCase):
+    """
+    Runs each test with `IOLoop.current()` returning a :ref:`VirtualLoop`.
+
+    :ivar clock: The :ref:`simulation.VirtualClock` of the test.
+    :ivar start: The virtual time the test started at.
+    """
+
+    def setUp(self):
+        self.clock = simulation.VirtualClock()
+        self.start = self.clock.now
+        loop = VirtualLoop(self.clock)
+
+        self.current = ioloop.IOLoop.__dict__['current']
+        ioloop.IOLoop.current = staticmethod(lambda *args, **kwargs: loop)
+
+    def tearDown(self):
+        ioloop.IOLoop.current = self.current
+
+    def elapsed(self):
+        """
+        The number of virtual seconds since the start of the test.
+        """
+        return self.clock.now - self.start